@@ -0,0 +1,50 @@
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.data import Danmu, _time_convert, _series_time_convert
+from benchmark.synthetic import write_danmu
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare per-row and vectorized danmu time parsing")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        danmu_file = Path(tmp) / "danmu.csv"
+        write_danmu(danmu_file, args.rows)
+
+        t = time.perf_counter()
+        data = pd.read_csv(danmu_file, header=None,
+                           names=["time", "streamer", "fan_name", "fan_level", "username", "content"], index_col=0)
+        read = time.perf_counter() - t
+
+        t = time.perf_counter()
+        expected = data["time"].apply(_time_convert).to_numpy(dtype=np.int64)
+        per_row = time.perf_counter() - t
+
+        t = time.perf_counter()
+        _series_time_convert(data["time"])
+        vectorized = time.perf_counter() - t
+
+        t = time.perf_counter()
+        danmu = Danmu(danmu_file)
+        load = time.perf_counter() - t
+
+    assert danmu.t0 == expected[0] * 1000
+    assert np.array_equal(danmu.data["time"].to_numpy(), (expected - expected[0]) * 1000)
+
+    print(f"rows: {args.rows}")
+    print(f"parse per row:    {per_row:.3f}s")
+    print(f"parse vectorized: {vectorized:.3f}s ({per_row / vectorized:.1f}x)")
+    print(f"Danmu load:       {load:.3f}s, before: {read + per_row:.3f}s ({(read + per_row) / load:.1f}x)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+from src.data import Data
+from benchmark.synthetic import write_sentences, write_danmu
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time Data loading a day of hourly transcripts serially and in parallel")
+    parser.add_argument("--files", type=int, default=24, help="number of hourly sentence files")
+    parser.add_argument("--sentence-rows", type=int, default=20000, help="sentences per hourly file")
+    parser.add_argument("--danmu-rows", type=int, default=500000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sen_dirs = []
+        for i in range(args.files):
+            write_sentences(Path(tmp) / f"{i}.csv", args.sentence_rows, seed=i)
+            sen_dirs.append((tmp, str(Path(tmp) / f"{i}.csv"), i * 3600000))
+        danmu_file = str(Path(tmp) / "danmu.csv")
+        write_danmu(danmu_file, args.danmu_rows)
+
+        t = time.perf_counter()
+        Data(sen_dirs[:1], danmu_file, workers=1)
+        single = time.perf_counter() - t
+
+        t = time.perf_counter()
+        Data(sen_dirs[:1], danmu_file)
+        launch = time.perf_counter() - t
+
+        t = time.perf_counter()
+        Data(sen_dirs, danmu_file, workers=1)
+        serial = time.perf_counter() - t
+
+        t = time.perf_counter()
+        Data(sen_dirs, danmu_file, workers=args.workers)
+        parallel = time.perf_counter() - t
+
+    print(f"1 file + danmu, 1 worker: {single:.3f}s")
+    print(f"1 file + danmu, default workers: {launch:.3f}s")
+    print(f"{args.files} files, 1 worker:  {serial:.3f}s")
+    print(f"{args.files} files, {args.workers} workers: {parallel:.3f}s")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
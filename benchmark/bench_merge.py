@@ -0,0 +1,67 @@
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from src.data import Sentences, Danmu
+from benchmark.synthetic import write_sentences, write_danmu
+
+
+def _concat_sort(parts, ts, column):
+    # the loading scheme Data used before merging: one concat per extra file, then a full sort
+    data = parts[0].data.copy()
+    for part, t in zip(parts[1:], ts[1:]):
+        part.shift(t)
+        data = pd.concat([data, part.data], ignore_index=True)
+        part.shift(-t)
+    data.insert(0, "index", data.index, True)
+    data.sort_values([column, "index"], inplace=True)
+    data.drop(columns="index", inplace=True)
+    return data.reset_index(drop=True)
+
+
+def _timed(f, *args):
+    t = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - t
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time merging hourly sentence files and several danmu files")
+    parser.add_argument("--sentence-rows", type=int, default=2000, help="sentences per hourly file")
+    parser.add_argument("--danmu-rows", type=int, default=200000, help="danmu per danmu file")
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 2, 4, 8, 16, 24])
+    args = parser.parse_args(argv)
+
+    n = max(args.files)
+    with tempfile.TemporaryDirectory() as tmp:
+        sentences, danmu = [], []
+        for i in range(n):
+            write_sentences(Path(tmp) / f"{i}.csv", args.sentence_rows, seed=i)
+            sentences.append(Sentences(tmp, Path(tmp) / f"{i}.csv"))
+        for i in range(min(n, 4)):
+            write_danmu(Path(tmp) / f"danmu_{i}.csv", args.danmu_rows, start=f"2023-12-22 {10 + i}:00:00", seed=i)
+            danmu.append(Danmu(Path(tmp) / f"danmu_{i}.csv"))
+
+    print(f"{'files':>5} {'rows':>10} {'concat+sort':>12} {'merge':>10} {'merge/row':>12}")
+    for k in args.files:
+        ts = [i * 3600000 for i in range(k)]
+        before = _timed(_concat_sort, sentences[:k], ts, "start")
+        after = _timed(Sentences.merge, sentences[:k], ts)
+        rows = k * args.sentence_rows
+        print(f"{k:>5} {rows:>10} {before:>11.4f}s {after:>9.4f}s {after / rows * 1e9:>10.1f}ns")
+
+    print()
+    for k in range(1, len(danmu) + 1):
+        ts = [d.t0 - danmu[0].t0 for d in danmu[:k]]
+        before = _timed(_concat_sort, danmu[:k], ts, "time")
+        after = _timed(Danmu.merge, danmu[:k], ts)
+        rows = k * args.danmu_rows
+        print(f"{k:>5} {rows:>10} {before:>11.4f}s {after:>9.4f}s {after / rows * 1e9:>10.1f}ns")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ["numpy", "pandas", "scipy", "scipy.sparse", "PyQt5.QtMultimedia"]
+
+# runs in a fresh interpreter, so every import is cold
+CHILD = f"""
+import sys, time, json
+t = time.perf_counter()
+from PyQt5 import QtWidgets
+app = QtWidgets.QApplication(sys.argv[:1])
+qt = time.perf_counter()
+from src.ui import PreMainWidget
+ui = time.perf_counter()
+window = PreMainWidget()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({{"qt": qt - t, "import_ui": ui - qt, "window": shown - ui,
+                  "heavy": [m for m in {HEAVY!r} if m in sys.modules]}}))
+"""
+
+
+def measure():
+    t = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["total"] = time.perf_counter() - t
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time from starting the interpreter to the launcher window shown")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if "DISPLAY" not in os.environ and "WAYLAND_DISPLAY" not in os.environ:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    runs = [measure() for _ in range(args.repeat)]
+    for phase in ("qt", "import_ui", "window", "total"):
+        print(f"{phase:<10} median {statistics.median(r[phase] for r in runs):.3f}s")
+    heavy = sorted(set(m for r in runs for m in r["heavy"]))
+    print(f"heavy modules loaded before the first window: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
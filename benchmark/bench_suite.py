@@ -0,0 +1,215 @@
+"""
+Time the main operations of the labeler on synthetic sessions of growing size and write the results as json
+
+    python -m benchmark.bench_suite --sizes 10000 100000 1000000 --out results.json
+    python -m benchmark.bench_suite --sizes 10000 100000 --compare results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmark.synthetic import make_session
+
+ROOT = Path(__file__).resolve().parent.parent
+# the results of the suite change shape with this
+SUITE_VERSION = 1
+
+
+def timed(f, repeat=1):
+    """
+    :return: (seconds of each run, result of the last run)
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = f()
+        runs.append(time.perf_counter() - t)
+    return runs, result
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"suite_version": SUITE_VERSION, "commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__}
+
+
+def bench_data(session, tmp, repeat, edits):
+    """
+    :return: list of (op, runs, ops per run) of the Qt free operations
+    """
+    from src.data import Data, Danmu, time_stamp
+    from src.project import save_project, load_project
+    from src.export import export_pairs
+    from src.suggest import Suggester
+    from src.search import SearchIndex
+    from src.filters import DanmuFilter
+
+    results = []
+
+    def record(op, f, n=1, times=repeat):
+        runs, result = timed(f, times)
+        results.append((op, runs, n))
+        return result
+
+    sen_dirs = [(session["wavs"], session["sentences"], 0)]
+    data = record("data_init", lambda: Data(sen_dirs, session["danmu"], workers=1))
+    ts0 = time_stamp(session["start"], "UTC +8")
+    record("shift_danmu", lambda: data.shift_danmu(data.danmu.t0 - ts0), times=1)
+    record("mk_timeline", data.mk_timeline)
+
+    rng = random.Random(0)
+    sen_idx = data.sentences.data.index.to_numpy()
+    dan_idx = data.danmu.data.index.to_numpy()
+    n = min(edits, len(sen_idx), len(dan_idx))
+    sen = [int(i) for i in rng.sample(list(sen_idx), n)]
+    dan = [int(i) for i in rng.sample(list(dan_idx), n)]
+
+    def delete():
+        for i in dan:
+            data.delete("danmu", i)
+
+    def modify():
+        for i in sen:
+            data.modify("sentence", i, "modified")
+
+    def match():
+        for l_idx, r_idx in zip(sen, dan):
+            data.match(l_idx, r_idx)
+
+    def undo():
+        for _ in range(3 * n):
+            data.undo()
+
+    def redo():
+        for _ in range(3 * n):
+            data.redo()
+
+    record("delete", delete, n, 1)
+    record("modify", modify, n, 1)
+    record("match", match, n, 1)
+    record("undo", undo, 3 * n, 1)
+    record("redo", redo, 3 * n, 1)
+
+    project = os.path.join(tmp, "session.psr")
+    record("save_project", lambda: save_project(data, project))
+    record("load_project", lambda: load_project(project))
+    record("export_pairs", lambda: export_pairs(data, os.path.join(tmp, "pairs.jsonl")))
+
+    record("suggest_rank", lambda: Suggester(data).rank(), times=1)
+    index = record("search_build", lambda: SearchIndex(data), times=1)
+    record("search_query", lambda: [index.search(q) for q in ("晚上好", "awsl", "user_1")], 3)
+
+    danmu_filter = record("filter_build", lambda: DanmuFilter(data.danmu), times=1)
+    record("filter_apply", lambda: data.filter_danmu(danmu_filter.mask(["streamer_a"], min_level=10)))
+    data.filter_danmu(None)
+
+    for sidecar in Path(tmp).rglob("*.tidx"):
+        sidecar.unlink()
+    t0 = data.danmu.t0
+    record("time_index_build", lambda: Danmu.read_span(session["danmu"], t0, t0 + 1), times=1)
+    record("read_span", lambda: Danmu.read_span(session["danmu"], t0 + 3600000, t0 + 5400000))
+    return results
+
+
+def bench_window(session, tmp, repeat):
+    """
+    :return: list of (op, runs, 1) of the Qt operations, empty if PyQt5 can not be used here
+    """
+    try:
+        from PyQt5 import QtWidgets
+    except ImportError as err:
+        print(f"skipping the window benchmarks: {err}", file=sys.stderr)
+        return []
+
+    from src.data import Data
+
+    os.environ.setdefault("PSR_AUTOSAVE_DIR", os.path.join(tmp, "autosave"))
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    from src.ui import MainWindow
+
+    data = Data([(session["wavs"], session["sentences"], 0)], session["danmu"], workers=1)
+
+    def construct():
+        window = MainWindow(data, 0)
+        window.show()
+        app.processEvents()
+        window.close()
+
+    runs, _ = timed(construct, repeat)
+    return [("main_window", runs, 1)]
+
+
+def compare(results, baseline):
+    """
+    Print the ratio of each median to the one of the same op and size in baseline
+    """
+    base = {(r["op"], r["danmu"]): r["median"] for r in baseline["results"]}
+    print(f"{'op':<18} {'danmu':>10} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for r in results:
+        old = base.get((r["op"], r["danmu"]))
+        if old:
+            print(f"{r['op']:<18} {r['danmu']:>10} {old:>10.4f} {r['median']:>10.4f} {r['median'] / old:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="danmu rows of each session, up to 10M")
+    parser.add_argument("--sentence-ratio", type=float, default=0.1, help="sentences per danmu")
+    parser.add_argument("--wav-rows", type=int, default=1000, help="sentences given a dummy wav")
+    parser.add_argument("--edits", type=int, default=1000, help="rows deleted, modified and matched")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-window", action="store_true", help="skip the offscreen MainWindow benchmarks")
+    parser.add_argument("--out", help="json file of the results")
+    parser.add_argument("--compare", help="json file of earlier results to compare with")
+    args = parser.parse_args(argv)
+
+    if "DISPLAY" not in os.environ and "WAYLAND_DISPLAY" not in os.environ:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    results = []
+    for size in args.sizes:
+        sentence_rows = max(int(size * args.sentence_ratio), 1)
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            session = make_session(tmp, sentence_rows, size, args.wav_rows)
+            print(f"generated {sentence_rows} sentences and {size} danmu in {time.perf_counter() - t:.1f}s",
+                  file=sys.stderr)
+            timings = bench_data(session, tmp, args.repeat, args.edits)
+            if not args.no_window:
+                timings += bench_window(session, tmp, args.repeat)
+
+        for op, runs, n in timings:
+            median = statistics.median(runs)
+            results.append({"op": op, "sentences": sentence_rows, "danmu": size, "ops": n, "runs": runs,
+                            "median": median, "per_op": median / n})
+            print(f"{op:<18} {size:>10} {median:>10.4f}s" + (f" {median / n * 1e6:>10.1f}us/op" if n > 1 else ""))
+
+    report = {"environment": environment(), "results": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import csv
+import wave
+import random
+import datetime
+from pathlib import Path
+
+from src.data import DANMU_TIME_FORMAT
+
+STREAMERS = ["streamer_a", "streamer_b", "streamer_c"]
+FAN_NAMES = ["fans_a", "fans_b", "fans_c"]
+WORDS = ["哈哈哈", "来了", "主播好", "666", "awsl", "草", "好耶", "晚上好", "？？？", "下次一定"]
+
+
+def write_danmu(file_path, rows, start="2023-12-22 22:28:30", rate=50, seed=0):
+    """
+    Write a danmu csv in the format of the live stream monitor
+
+    :param file_path: output file path
+    :param rows: number of danmu
+    :param start: time of the first danmu, formatted as DANMU_TIME_FORMAT
+    :param rate: average number of danmu per second
+    :param seed: random seed
+    """
+    rng = random.Random(seed)
+    t = datetime.datetime.strptime(start, DANMU_TIME_FORMAT)
+    second = datetime.timedelta(seconds=1)
+    t_str = t.strftime(DANMU_TIME_FORMAT)
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for i in range(rows):
+            if rng.random() * rate < 1:
+                t += second
+                t_str = t.strftime(DANMU_TIME_FORMAT)
+            k = rng.randrange(len(STREAMERS))
+            writer.writerow([i, t_str, STREAMERS[k], FAN_NAMES[k], rng.randint(1, 30), f"user_{rng.randrange(rows // 10 + 1)}",
+                             "".join(rng.choices(WORDS, k=rng.randint(1, 4)))])
+
+
+def write_sentences(file_path, rows, start=0, seed=0):
+    """
+    Write a whisper style sentence csv
+
+    :param file_path: output file path
+    :param rows: number of sentences
+    :param start: start time of the first sentence in ms
+    :param seed: random seed
+    """
+    rng = random.Random(seed)
+    t = start
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for i in range(rows):
+            t += rng.randint(0, 500)
+            end = t + rng.randint(500, 6000)
+            writer.writerow([i, t, end, "".join(rng.choices(WORDS, k=rng.randint(2, 8)))])
+            t = end
+
+
+def write_wavs(folder, sentence_file, rows=None, sample_rate=8000, duration=100):
+    """
+    Write a dummy wav of silence for each sentence, named as the launcher looks for it
+
+    :param folder: output folder of the splitted sentences
+    :param sentence_file: sentence csv written by write_sentences
+    :param rows: number of sentences given a wav, from the first; None for every sentence
+    :param sample_rate: samples per second of the 16 bit mono wavs
+    :param duration: ms of each wav, kept short so large sessions stay small on disk
+    """
+    os.makedirs(folder, exist_ok=True)
+    frames = bytes(2 * sample_rate * duration // 1000)
+    with open(sentence_file, newline="", encoding="utf-8") as file:
+        for i, (_, start, end, _) in enumerate(csv.reader(file)):
+            if rows is not None and i >= rows:
+                break
+            with wave.open(os.path.join(folder, f"{start}_{end}.wav"), "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(sample_rate)
+                wav.writeframes(frames)
+
+
+def make_session(root, sentence_rows, danmu_rows, wav_rows=None, seed=0):
+    """
+    Write a whole synthetic session: a transcript, its wav folder and a danmu file starting with it
+
+    :param root: output directory
+    :param wav_rows: number of sentences given a wav; None for every sentence
+    :return: dict of the sentences csv, wav folder, danmu csv and start time YYYYMMDD-hhmmss of the session
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    start = datetime.datetime(2023, 12, 22, 22, 28, 26)
+    session = {"sentences": str(root / "sentences.csv"), "wavs": str(root / "sentences"),
+               "danmu": str(root / "danmu.csv"), "start": start.strftime("%Y%m%d-%H%M%S")}
+    write_sentences(session["sentences"], sentence_rows, seed=seed)
+    write_wavs(session["wavs"], session["sentences"], wav_rows)
+    write_danmu(session["danmu"], danmu_rows, start=start.strftime(DANMU_TIME_FORMAT), seed=seed)
+    return session
@@ -0,0 +1,249 @@
+import os
+import wave
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5 import QtCore
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class Clip:
+    def __init__(self, channels, sample_width, frame_rate, frames):
+        """
+        Decoded pcm audio of one sentence
+
+        :param channels: number of channels
+        :param sample_width: bytes per sample
+        :param frame_rate: frames per second
+        :param frames: interleaved little endian pcm samples, bytes or a uint8 array viewing a mapped file
+        """
+        self.channels = channels
+        self.sample_width = sample_width
+        self.frame_rate = frame_rate
+        self.frames = frames
+
+    def __len__(self):
+        return len(self.frames)
+
+    def frame_bytes(self):
+        return self.channels * self.sample_width
+
+    def audio_format(self):
+        from PyQt5 import QtMultimedia
+
+        fmt = QtMultimedia.QAudioFormat()
+        fmt.setCodec("audio/pcm")
+        fmt.setByteOrder(QtMultimedia.QAudioFormat.LittleEndian)
+        fmt.setChannelCount(self.channels)
+        fmt.setSampleRate(self.frame_rate)
+        fmt.setSampleSize(self.sample_width * 8)
+        # 8 bit wav is unsigned, wider wav is signed
+        if self.sample_width == 1:
+            fmt.setSampleType(QtMultimedia.QAudioFormat.UnSignedInt)
+        else:
+            fmt.setSampleType(QtMultimedia.QAudioFormat.SignedInt)
+        return fmt
+
+
+def read_clip(file_path):
+    with wave.open(str(file_path), "rb") as file:
+        return Clip(file.getnchannels(), file.getsampwidth(), file.getframerate(), file.readframes(file.getnframes()))
+
+
+def map_wav(file_path):
+    """
+    Memory map the samples of a pcm wav file without reading them
+
+    :return: Clip of the whole file, its frames a read only uint8 array over the data chunk
+    """
+    with open(file_path, "rb") as file:
+        riff, _, form = struct.unpack("<4sI4s", file.read(12))
+        if riff != b"RIFF" or form != b"WAVE":
+            raise wave.Error(f"{file_path} is not a wav file")
+        fmt = None
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise wave.Error(f"{file_path} has no data chunk")
+            chunk, size = struct.unpack("<4sI", header)
+            if chunk == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", file.read(16))
+                file.seek(size - 16 + (size & 1), 1)
+            elif chunk == b"data":
+                offset = file.tell()
+                break
+            else:
+                file.seek(size + (size & 1), 1)
+
+    if fmt is None or fmt[0] not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE):
+        raise wave.Error(f"{file_path} is not pcm")
+    _, channels, frame_rate, _, block_align, bits = fmt
+    # the data chunk of a recording cut short may claim more bytes than were written
+    size = min(size, os.path.getsize(file_path) - offset)
+    size -= size % block_align
+    frames = np.memmap(file_path, dtype=np.uint8, mode="r", offset=offset, shape=(size,)) if size else np.empty(0, np.uint8)
+    return Clip(channels, bits // 8, frame_rate, frames)
+
+
+class ClipDevice(QtCore.QIODevice):
+    def __init__(self, clip, parent=None):
+        """
+        Read only device over the frames of a clip, so a mapped clip is paged in as it plays instead of being copied
+        """
+        super(ClipDevice, self).__init__(parent)
+        self.frames = clip.frames
+        self.pos_ = 0
+
+    def readData(self, max_size):
+        chunk = self.frames[self.pos_:self.pos_ + max_size]
+        self.pos_ += len(chunk)
+        return bytes(chunk)
+
+    def writeData(self, data):
+        return -1
+
+    def bytesAvailable(self):
+        return len(self.frames) - self.pos_ + super(ClipDevice, self).bytesAvailable()
+
+    def size(self):
+        return len(self.frames)
+
+    def seek(self, pos):
+        self.pos_ = min(max(pos, 0), len(self.frames))
+        return super(ClipDevice, self).seek(pos)
+
+
+class AudioService(QtCore.QObject):
+    def __init__(self, sentences, max_bytes=64 * 1024 ** 2, workers=2, parent=None):
+        """
+        Plays sentences by idx. Sentences cut into their own files are decoded into an LRU cache, which is filled
+        ahead of time by prefetch; sentences of a session wav are sliced out of the memory mapped file.
+
+        :param sentences: Sentences whose wav_file and wav_start columns locate the audio
+        :param max_bytes: size limit of the cached pcm data
+        :param workers: number of threads reading and decoding clips in the background
+        """
+        super(AudioService, self).__init__(parent)
+        self.sentences = sentences
+        self.max_bytes = max_bytes
+
+        self._clips = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(workers)
+        self._closed = False
+
+        self._output = None
+        self._buffer = None
+
+    def wav_file(self, idx):
+        return self.sentences.data.loc[idx, "wav_file"]
+
+    def wav_start(self, idx):
+        """
+        :return: start of sentence idx in ms into its session wav, negative if the sentence has a wav file of its own
+        """
+        data = self.sentences.data
+        return data.loc[idx, "wav_start"] if "wav_start" in data else -1
+
+    def session(self, file_path):
+        with self._lock:
+            whole = self._sessions.get(file_path)
+            if whole is None:
+                whole = self._sessions[file_path] = map_wav(file_path)
+        return whole
+
+    def _slice(self, idx):
+        row = self.sentences.data.loc[idx]
+        whole = self.session(row["wav_file"])
+        step = whole.frame_bytes()
+        begin = int(row["wav_start"]) * whole.frame_rate // 1000 * step
+        end = begin + int(row["end"] - row["start"]) * whole.frame_rate // 1000 * step
+        return Clip(whole.channels, whole.sample_width, whole.frame_rate, whole.frames[begin:end])
+
+    def _load(self, idx):
+        try:
+            clip = read_clip(self.wav_file(idx))
+        finally:
+            with self._lock:
+                self._pending.pop(idx, None)
+        with self._lock:
+            if idx not in self._clips:
+                self._clips[idx] = clip
+                self._bytes += len(clip)
+                while self._bytes > self.max_bytes and len(self._clips) > 1:
+                    _, old = self._clips.popitem(last=False)
+                    self._bytes -= len(old)
+        return clip
+
+    def clip(self, idx):
+        """
+        :return: the decoded Clip of sentence idx, read now if it is neither cached nor being prefetched
+        """
+        if self.wav_start(idx) >= 0:
+            return self._slice(idx)
+        with self._lock:
+            clip = self._clips.get(idx)
+            if clip is not None:
+                self._clips.move_to_end(idx)
+                return clip
+            future = self._pending.get(idx)
+        if future is not None:
+            return future.result()
+        return self._load(idx)
+
+    def prefetch(self, indices):
+        """
+        Decode the clips of the sentences in the background, so playing them later does not touch the disk
+        """
+        if self._closed:
+            return
+        data = self.sentences.data
+        if "wav_start" in data and len(indices):
+            # slicing a mapped session needs no prefetch
+            indices = [idx for idx, start in zip(indices, data.loc[indices, "wav_start"]) if start < 0]
+        with self._lock:
+            missing = [idx for idx in indices if idx not in self._clips and idx not in self._pending]
+            for idx in missing:
+                self._pending[idx] = self._executor.submit(self._load, idx)
+
+    def play(self, idx):
+        # QtMultimedia is loaded when the first sentence is played, not when the window opens
+        from PyQt5 import QtMultimedia
+
+        try:
+            clip = self.clip(idx)
+        except (OSError, EOFError, wave.Error) as err:
+            if self.wav_start(idx) >= 0:
+                print(err)
+                return
+            # not a pcm wav file, let Qt decode it
+            QtMultimedia.QSound.play(str(self.wav_file(idx)))
+            return
+
+        self.stop()
+        self._buffer = ClipDevice(clip, self)
+        self._buffer.open(QtCore.QIODevice.ReadOnly)
+        self._output = QtMultimedia.QAudioOutput(clip.audio_format(), self)
+        self._output.start(self._buffer)
+
+    def stop(self):
+        if self._output is not None:
+            self._output.stop()
+            self._output = None
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+
+    def close(self):
+        self.stop()
+        self._closed = True
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._sessions.clear()
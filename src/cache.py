@@ -0,0 +1,110 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from .columnar import frame_to_arrays, arrays_to_frame
+
+CACHE_VERSION = 1
+CACHE_DIR = Path.home() / ".cache" / "psr_datalabeler"
+
+
+class ParseCache:
+    def __init__(self, root=None, max_bytes=1024 ** 3):
+        """
+        Cache of parsed input files, stored as one .npy file per column so a warm load needs no csv parsing
+
+        :param root: cache directory; defaults to $PSR_CACHE_DIR or ~/.cache/psr_datalabeler
+        :param max_bytes: size limit of the cache, least recently used entries are evicted beyond it
+        """
+        self.root = Path(root or os.environ.get("PSR_CACHE_DIR") or CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def key(self, file_path, *extra):
+        """
+        :param file_path: the input file
+        :param extra: anything else the parsed result depends on
+        :return: key of the file in its current state, changes with its path, size and mtime
+        """
+        stat = os.stat(file_path)
+        ident = [CACHE_VERSION, os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, *map(str, extra)]
+        return hashlib.sha1(json.dumps(ident).encode("utf-8")).hexdigest()
+
+    def load(self, file_path, *extra):
+        """
+        :return: the cached DataFrame of file_path, or None if it is not cached
+        """
+        entry = self.root / self.key(file_path, *extra)
+        try:
+            with open(entry / "meta.json", encoding="utf-8") as file:
+                meta = json.load(file)
+            arrays = {name: np.load(entry / f"{name}.npy", mmap_mode="c") for name in meta["arrays"]}
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            # evicted by another process meanwhile, the mapped files stay readable
+            pass
+        return arrays_to_frame(arrays, meta["columns"])
+
+    def store(self, file_path, data, *extra):
+        """
+        :param file_path: the input file
+        :param data: DataFrame parsed from file_path
+        """
+        entry = self.root / self.key(file_path, *extra)
+        if entry.exists():
+            return
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp"))
+        try:
+            arrays = frame_to_arrays(data)
+            for name, array in arrays.items():
+                np.save(tmp / f"{name}.npy", array, allow_pickle=False)
+            with open(tmp / "meta.json", "w", encoding="utf-8") as file:
+                json.dump({"file": os.path.abspath(file_path), "columns": list(data.columns),
+                           "arrays": list(arrays)}, file)
+            os.rename(tmp, entry)
+        except OSError:
+            # another process stored the same entry first, or the cache is not writable
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes. Entries that other processes remove
+        meanwhile are skipped, the cache is best-effort.
+        """
+        entries = []
+        total = 0
+        try:
+            listing = list(self.root.iterdir())
+        except OSError:
+            return
+        for entry in listing:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if not entry.is_dir():
+                    continue
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
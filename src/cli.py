@@ -0,0 +1,233 @@
+"""
+Batch processing of labeling sessions without a GUI; nothing here imports PyQt5
+
+    python -m src.cli stats --sentences 20231222-222826.csv 20231222-222826 --danmu danmu.csv --labels session.psr
+    python -m src.cli export --manifest sessions.json --out pairs/ --jobs 8
+
+A manifest is a json list of sessions, each either {"project": file} or
+{"sentences": [[file, start], ...], "danmu": [file, ...], "time_zone": "UTC +8", "labels": file}, with an optional
+"name". Start times are YYYYMMDD-hhmmss, as in the launcher.
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .data import Data, time_stamp
+from .cache import ParseCache
+from .project import load_project, apply_labels
+from .export import FORMATS, capture, write_export, export_format
+from .exceptions import ProjectFormatError
+
+TIME_ZONE = "UTC +8"
+
+
+def session_name(session):
+    if session.get("name"):
+        return session["name"]
+    file_path = session.get("project") or session["sentences"][0][0]
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def unique_names(sessions):
+    """
+    Name every session, numbering the names which repeat, so their export files do not overwrite each other
+
+    :param sessions: list of session dicts, given a "name" in place
+    """
+    names = [session_name(session) for session in sessions]
+    taken = set(names)
+    seen = set()
+    for session, name in zip(sessions, names):
+        if name in seen:
+            i = 2
+            while f"{name}-{i}" in taken:
+                i += 1
+            name = f"{name}-{i}"
+            taken.add(name)
+        seen.add(name)
+        session["name"] = name
+
+
+def load_session(session, cache=None):
+    """
+    :param session: dict describing the session, as an entry of a manifest
+    :param cache: ParseCache of the input files, or None
+    :return: Data of the session with its labels applied, shifted as the launcher shifts it
+    """
+    if session.get("project"):
+        return load_project(session["project"])
+
+    time_zone = session.get("time_zone", TIME_ZONE)
+    starts = [time_stamp(start, time_zone) for _, start in session["sentences"]]
+    ts0 = starts[0]
+    # the audio of a transcript is looked for where the launcher looks by default
+    sen_dirs = [(os.path.splitext(file_path)[0], file_path, ts - ts0)
+                for (file_path, _), ts in zip(session["sentences"], starts)]
+    data = Data(sen_dirs, session["danmu"], workers=1, cache=cache)
+    data.shift_danmu(data.danmu.t0 - ts0)
+
+    if session.get("labels"):
+        apply_labels(data, load_project(session["labels"]))
+    return data
+
+
+def stats(data):
+    """
+    :return: dict of the sizes of the session and the latencies of its replies in ms
+    """
+    columns = {"latency": [], "sentence_idx": [], "danmu_idx": []}
+    for chunk in capture(data)():
+        for column, arrays in columns.items():
+            arrays.append(chunk[column].to_numpy())
+    latency, sentence_idx, danmu_idx = (np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64)
+                                        for arrays in columns.values())
+    result = {"sentences": int(data.sentences.alive.sum()),
+              "danmu": int(data.danmu.alive.sum()),
+              "deleted_sentences": int((~data.sentences.alive).sum()),
+              "deleted_danmu": int((~data.danmu.alive).sum()),
+              "links": len(latency),
+              "linked_sentences": len(np.unique(sentence_idx)),
+              "linked_danmu": len(np.unique(danmu_idx))}
+    if len(latency):
+        result.update(latency_mean=float(latency.mean()), latency_median=float(np.median(latency)),
+                      latency_min=float(latency.min()), latency_max=float(latency.max()))
+    return result
+
+
+def validate(data):
+    """
+    :return: list of the problems found in the session
+    """
+    problems = []
+    sentences = data.sentences.data[data.sentences.alive]
+    danmu = data.danmu.data[data.danmu.alive]
+
+    backwards = sentences.index[sentences["end"] < sentences["start"]]
+    if len(backwards):
+        problems.append(f"{len(backwards)} sentences end before they start, first {backwards[0]}")
+    if danmu["time"].isna().any():
+        problems.append(f"{int(danmu['time'].isna().sum())} danmu have no time")
+    for name, table in (("sentences", sentences), ("danmu", danmu)):
+        empty = int(table["content"].isna().sum())
+        if empty:
+            problems.append(f"{empty} {name} have no content")
+
+    rows, cols = data.dialogue.nonzero()
+    dangling = ~(np.isin(rows, sentences.index.to_numpy()) & np.isin(cols, danmu.index.to_numpy()))
+    if dangling.any():
+        problems.append(f"{int(dangling.sum())} links to missing or deleted rows, first {rows[dangling][0]}-"
+                        f"{cols[dangling][0]}")
+    return problems
+
+
+def run(command, session, out=None, fmt="jsonl", use_cache=True):
+    """
+    Run one command on one session; called in the worker processes
+
+    :return: dict of the result, reported as a json line
+    """
+    name = session_name(session)
+    result = {"session": name}
+    try:
+        data = load_session(session, ParseCache() if use_cache else None)
+    except (OSError, ValueError, KeyError, IndexError, ProjectFormatError) as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+        return result
+
+    try:
+        if command == "export":
+            if os.path.isdir(out):
+                out = os.path.join(out, f"{name}.{fmt}")
+            result["file"] = out
+            result["records"] = write_export(capture(data, name), out)
+        elif command == "stats":
+            result.update(stats(data))
+        elif command == "validate":
+            result["problems"] = validate(data)
+    except (OSError, ValueError) as err:
+        result["error"] = f"{type(err).__name__}: {err}"
+    return result
+
+
+def report(results):
+    """
+    Print each result as a json line as soon as it is ready
+
+    :return: number of sessions which failed or have problems
+    """
+    failed = 0
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+        failed += "error" in result or bool(result.get("problems"))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["export", "stats", "validate"])
+    parser.add_argument("--sentences", nargs=2, action="append", metavar=("FILE", "START"), default=[],
+                        help="transcript csv and its start time YYYYMMDD-hhmmss; repeat for more transcripts")
+    parser.add_argument("--danmu", action="append", default=[], help="danmu csv; repeat for more files")
+    parser.add_argument("--time-zone", default=TIME_ZONE, help="time zone of the start times, e.g. \"UTC +8\"")
+    parser.add_argument("--labels", help="project whose labels are applied to the session")
+    parser.add_argument("--project", action="append", default=[], help="saved project; repeat for more sessions")
+    parser.add_argument("--manifest", help="json file listing the sessions")
+    parser.add_argument("--out", help="export file, or directory of one file per session, created if missing; a "
+                                      "path ending with a separator or without a suffix is a directory")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="format of the files exported to a directory, jsonl by default; an export file has the "
+                             "format of its suffix")
+    parser.add_argument("--jobs", type=int, default=1, help="number of sessions processed in parallel")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the csv files")
+    args = parser.parse_args(argv)
+
+    sessions = [{"project": project} for project in args.project]
+    if args.sentences or args.danmu:
+        if not (args.sentences and args.danmu):
+            parser.error("a session needs both --sentences and --danmu")
+        sessions.append({"sentences": args.sentences, "danmu": args.danmu, "time_zone": args.time_zone,
+                         "labels": args.labels})
+    if args.manifest:
+        with open(args.manifest, encoding="utf-8") as file:
+            sessions += json.load(file)
+    if not sessions:
+        parser.error("no session given")
+    unique_names(sessions)
+
+    fmt = args.format or "jsonl"
+    if args.command == "export":
+        if not args.out:
+            parser.error("export needs --out")
+        to_dir = (len(sessions) > 1 or os.path.isdir(args.out) or args.out.endswith(("/", os.sep))
+                  or not os.path.splitext(args.out)[1])
+        if to_dir:
+            try:
+                os.makedirs(args.out, exist_ok=True)
+            except OSError as err:
+                parser.error(f"can not make --out directory: {err}")
+        else:
+            try:
+                fmt = export_format(args.out)
+            except ValueError as err:
+                parser.error(str(err))
+            if args.format and args.format != fmt:
+                parser.error(f"--format {args.format} does not match the suffix of --out {args.out}")
+            if not os.path.isdir(os.path.dirname(os.path.abspath(args.out))):
+                parser.error(f"the directory of --out {args.out} does not exist")
+
+    runs = [(args.command, session, args.out, fmt, not args.no_cache) for session in sessions]
+    if args.jobs > 1 and len(runs) > 1:
+        with ProcessPoolExecutor(min(args.jobs, len(runs))) as executor:
+            results = executor.map(run, *zip(*runs))
+            failed = report(results)
+    else:
+        failed = report(run(*r) for r in runs)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+INDEX = "__index__"
+SEP = "\0"
+
+
+def encode_strings(values):
+    """
+    :param values: sequence of str, missing values may be None or NaN
+    :return: (utf8, codes)
+        utf8: uint8 array of the distinct strings joined by NUL and utf-8 encoded
+        codes: int64 array, position of each value among the distinct strings, -1 where the value is missing
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    uniques = [str(u) for u in uniques]
+    if any(SEP in u for u in uniques):
+        raise ValueError("strings containing NUL can not be encoded")
+    utf8 = np.frombuffer(SEP.join(uniques).encode("utf-8"), dtype=np.uint8)
+    return utf8, codes.astype(np.int64)
+
+
+def decode_strings(utf8, codes):
+    """
+    Inverse of encode_strings
+
+    :return: object array of str, NaN where the value is missing, as read_csv gives
+    """
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.empty(0, dtype=object)
+    uniques = bytes(utf8).decode("utf-8").split(SEP)
+    # the extra NaN at position -1 is picked up by the missing values
+    table = np.array(uniques + [np.nan], dtype=object)
+    return table[codes]
+
+
+def frame_to_arrays(data: pd.DataFrame):
+    """
+    :return: dict of numpy arrays; numeric columns are kept as they are and object columns become string tables
+        stored as "<column>.utf8" and "<column>.codes"
+    """
+    arrays = {INDEX: data.index.to_numpy()}
+    for column in data.columns:
+        values = data[column]
+        if values.dtype == object:
+            arrays[f"{column}.utf8"], arrays[f"{column}.codes"] = encode_strings(values)
+        else:
+            arrays[column] = values.to_numpy()
+    return arrays
+
+
+def arrays_to_frame(arrays, columns):
+    """
+    Inverse of frame_to_arrays. The numeric columns and the index are the given arrays, not copies, so arrays memory
+    mapped copy-on-write are only read from disk as they are used and never written back.
+
+    :param arrays: mapping of array name to array
+    :param columns: column names of the frame, in order
+    """
+    data = {}
+    for column in columns:
+        if column in arrays:
+            data[column] = arrays[column]
+        else:
+            data[column] = decode_strings(arrays[f"{column}.utf8"], arrays[f"{column}.codes"])
+    return pd.DataFrame(data, index=arrays[INDEX], columns=columns, copy=False)
@@ -1,64 +1,252 @@
+import io
 import os
 import time
 import datetime
+from collections import namedtuple
 from collections.abc import Iterable
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-import scipy
 
+from .timeindex import TimeIndex
+
+DANMU_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# total bytes of the input files above which they are loaded in parallel processes
+PARALLEL_BYTES = 64 * 1024 ** 2
+# columns of the csv files after their first, the index
+SENTENCE_COLUMNS = ["start", "end", "content"]
+DANMU_COLUMNS = ["time", "streamer", "fan_name", "fan_level", "username", "content"]
+
+# one change made to Data; where is "sentence", "danmu" or "dialogue", action is "delete", "modify" or "match",
+# idx is a row index, or (sentence idx, danmu idx) for the dialogue, before and after are the values it changes between
+Edit = namedtuple("Edit", ["where", "action", "idx", "before", "after"])
+
+
+def _resolve_local(t):
+    """
+    :param t: wall clock time in seconds, read as if it were UTC
+    :return: its unix timestamp in the local time zone. A wall time repeated by a DST change is taken at its first
+        occurrence, as with a time zone given, and one skipped by it is shifted forward by an hour; time.mktime with
+        tm_isdst=-1, which _time_convert uses, resolves them depending on its earlier calls.
+    """
+    wall = time.gmtime(t)
+    valid = []
+    for isdst in (1, 0):
+        ts = int(time.mktime(wall[:8] + (isdst,)))
+        if time.localtime(ts)[:6] == wall[:6]:
+            valid.append(ts)
+    return min(valid) if valid else _resolve_local(t + 3600)
+
+
+def _local_offsets(naive):
+    """
+    :param naive: wall clock times in seconds, read as if they were UTC
+    :return: offset of the local time zone at each time, naive + offset being its unix timestamp
+    """
+    # the offset is looked up once per distinct hour, except next to a DST change, where each distinct time is
+    # resolved on its own
+    hours, codes = np.unique(naive // 3600, return_inverse=True)
+    around = np.unique(np.concatenate([hours - 1, hours, hours + 1]))
+    at = np.array([_resolve_local(h * 3600) - h * 3600 for h in around.tolist()], dtype=np.int64)
+    before, hourly, after = (at[np.searchsorted(around, h)] for h in (hours - 1, hours, hours + 1))
+    offsets = hourly[codes]
+
+    unsure = ((before != hourly) | (after != hourly))[codes]
+    if unsure.any():
+        times, inverse = np.unique(naive[unsure], return_inverse=True)
+        offsets[unsure] = np.array([_resolve_local(t) - t for t in times.tolist()], dtype=np.int64)[inverse]
+    return offsets
+
+
+def _timed(times: pd.Series):
+    """
+    :param times: danmu times as read from a danmu file
+    :return: mask of the times which parse as DANMU_TIME_FORMAT; danmu whose time does not are left out, as the time
+        index of the file leaves them out
+    """
+    codes, uniques = pd.factorize(times)
+    parsed = pd.to_datetime(uniques, format=DANMU_TIME_FORMAT, errors="coerce")
+    # a missing time has code -1
+    return np.r_[~parsed.isna(), False][codes]
+
+
+def _series_time_convert(times: pd.Series, time_zone=None):
+    """
+    :param times: danmu times formatted as DANMU_TIME_FORMAT
+    :param time_zone: time zone of the times, a tz name, a tzinfo or an hour offset; None for the local time zone
+    :return: unix timestamps in seconds
+    """
+    # danmu are recorded at second resolution, so only the distinct times are parsed
+    codes, uniques = pd.factorize(times)
+    t = pd.DatetimeIndex(pd.to_datetime(uniques, format=DANMU_TIME_FORMAT))
+    if time_zone is None:
+        naive = t.asi8 // 10**9
+        seconds = naive + _local_offsets(naive)
+    else:
+        if isinstance(time_zone, (int, float)):
+            time_zone = datetime.timezone(datetime.timedelta(hours=time_zone))
+        t = t.tz_localize(time_zone, ambiguous=np.ones(len(t), dtype=bool), nonexistent=pd.Timedelta(hours=1))
+        seconds = t.tz_convert(None).asi8 // 10**9
+    return pd.Series(seconds[codes], index=times.index, name=times.name)
+
+
+def _wav_full_names(sen_dir, start: pd.Series, end: pd.Series):
+    return os.path.join(sen_dir, "") + start.astype(str) + "_" + end.astype(str) + ".wav"
+
+
+def _with_audio(data, sen_dir):
+    """
+    Add where the audio of each sentence is to freshly read sentences, whose times are not shifted yet
+
+    :param sen_dir: directory of splitted sentences, or the .wav file of the whole session
+    """
+    if str(sen_dir).lower().endswith(".wav"):
+        # every sentence is played from its own start to end in the session audio
+        data.insert(3, "wav_file", str(sen_dir), True)
+        data.insert(4, "wav_start", data["start"].to_numpy(copy=True), True)
+    else:
+        data.insert(3, "wav_file", _wav_full_names(sen_dir, data["start"], data["end"]), True)
+        data.insert(4, "wav_start", -1, True)
+    return data
+
+
+def _merge_sorted(frames, column):
+    """
+    Merge frames which are each sorted by column into one frame sorted by column. Rows with equal values keep the
+    order of the frames, then their order within each frame.
+
+    :return: the merged frame, and for each of its rows the position of that row in the concatenated frames
+    """
+    data = pd.concat(frames, ignore_index=True)
+    # a stable argsort is a timsort, which merges the already sorted runs of the frames instead of sorting from scratch
+    order = np.argsort(data[column].to_numpy(), kind="stable")
+    return data.take(order).reset_index(drop=True), order
+
+
+def _read_csv(file_path, names, cache=None, convert=None, *extra):
+    """
+    :param file_path: csv file without header, whose first column is the index
+    :param names: names of the other columns
+    :param cache: ParseCache to read the parsed file from and store it to, or None
+    :param convert: function applied to the freshly parsed DataFrame before it is cached
+    :param extra: anything else convert depends on, part of the cache key
+    """
+    data = cache.load(file_path, *extra) if cache else None
+    if data is None:
+        data = pd.read_csv(file_path, header=None, names=names, index_col=0)
+        if convert:
+            data = convert(data)
+        if cache:
+            cache.store(file_path, data, *extra)
+    return data
+
+
+def _load_all(jobs, workers=None):
+    """
+    :param jobs: list of (loader, args, file_path); file_path is used to start the largest files first
+    :param workers: number of worker processes; None for the number of CPUs, 1 to load in this process
+    :return: results of the loaders, in the order of jobs
+    """
+    sizes = [os.path.getsize(file_path) for _, _, file_path in jobs]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    # starting the processes takes seconds where they are spawned, more than parsing a few small files
+    if workers <= 1 or sum(sizes) < PARALLEL_BYTES:
+        return [loader(*args) for loader, args, _ in jobs]
+
+    order = sorted(range(len(jobs)), key=lambda i: -sizes[i])
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {i: executor.submit(jobs[i][0], *jobs[i][1]) for i in order}
+        return [futures[i].result() for i in range(len(jobs))]
 
-def _series_time_convert(times: pd.Series):
-    return times.apply(_time_convert)
 
+def _time_convert(t):
+    return int(time.mktime(datetime.datetime.strptime(t, DANMU_TIME_FORMAT).timetuple()))
 
-def _wav_full_name(sen_dir):
-    def _wav_name(s: pd.Series):
-        return f"{sen_dir}\\{s.iloc[0]}_{s.iloc[1]}.wav"
-    return _wav_name
 
+def time_stamp(t, time_zone):
+    """
 
-def _time_convert(t):
-    return int(time.mktime(datetime.datetime.strptime(t, "%Y-%m-%d %H:%M:%S").timetuple()))
+    :param t: YYYYMMDD-hhmmss
+    :param time_zone: UTC n
+    :return:
+    """
+    ts = int(time.mktime(datetime.datetime.strptime(t, "%Y%m%d-%H%M%S").timetuple())) - int(time_zone.split()[1]) * 3600
+    return ts*1000
 
 
 class Data:
-    def __init__(self, sen_dirs, danmu_file):
+    def __init__(self, sen_dirs, danmu_file, workers=None, cache=None, time_zone=None, timeline=True):
         """
-        :param sen_dir: directory of splitted sentences
-        :param sen_txt_dir: file path to the transcripted senteces
-        :param danmu_file: file path to the danmu file
+        :param sen_dirs: list of (sen_dir, sen_txt_file, t)
+            sen_dir: directory of splitted sentences
+            sen_txt_file: file path to the transcripted senteces
+            t: time offset of the sentences in ms
+        :param danmu_file: file path to the danmu file, or a list of them
+        :param workers: number of processes loading the files in parallel; None for the number of CPUs. Files smaller
+            than PARALLEL_BYTES in total are loaded in this process either way.
+        :param cache: ParseCache of the parsed files, or None to always parse them
+        :param time_zone: time zone the danmu times are recorded in; None for the local time zone
+        :param timeline: build the timeline of the view; False for data which is only saved or exported, leaving
+            Data.timeline None
         """
-        sen_dir, sen_txt_file, _ = sen_dirs[0]
-        self.sentences = Sentences(sen_dir, sen_txt_file)
-        for sen_dir, sen_txt_file, t in sen_dirs[1:]:
-            self.sentences.append(Sentences(sen_dir, sen_txt_file), t)
-
-        self.sentences.data.insert(0, "index", self.sentences.data.index, True)
-        self.sentences.data.sort_values(["start", "index"], inplace=True)
-        self.sentences.data.drop(columns="index", inplace=True)
-        self.sentences.data.reset_index(drop=True, inplace=True)
-
         if isinstance(danmu_file, str):
-            self.danmu = Danmu(danmu_file)
-        elif isinstance(danmu_file, list) or isinstance(danmu_file, tuple):
-            self.danmu = Danmu(danmu_file[0])
-            t0 = self.danmu.t0
-            for df in danmu_file[1:]:
-                danmu = Danmu(df)
-                self.danmu.append(danmu, danmu.t0-t0)
-        else:
+            danmu_file = [danmu_file]
+        elif not (isinstance(danmu_file, list) or isinstance(danmu_file, tuple)):
             raise
 
-        self.danmu.data.insert(0, "index", self.danmu.data.index, True)
-        self.danmu.data.sort_values(["time", "index"], inplace=True)
-        self.danmu.data.drop(columns="index", inplace=True)
-        self.danmu.data.reset_index(drop=True, inplace=True)
+        jobs = [(Sentences, (sen_dir, sen_txt_file, None, cache), sen_txt_file) for sen_dir, sen_txt_file, _ in sen_dirs]
+        jobs += [(Danmu, (df, time_zone, None, None, cache), df) for df in danmu_file]
+        loaded = _load_all(jobs, workers)
+
+        # the inputs, which the row indices of a session depend on
+        self.sources = [(sen_txt_file, t) for _, sen_txt_file, t in sen_dirs] + [(df, 0) for df in danmu_file]
+        self.sentences = Sentences.merge(loaded[:len(sen_dirs)], [t for _, _, t in sen_dirs])
+
+        danmu = loaded[len(sen_dirs):]
+        t0 = danmu[0].t0
+        self.danmu = Danmu.merge(danmu, [d.t0-t0 for d in danmu])
 
-        self.mk_timeline()
+        self._setup(timeline=timeline)
 
+    @classmethod
+    def from_tables(cls, sentences, danmu, dialogue=None, sources=()):
+        """
+        Data of tables which are already loaded, as from a project
+
+        :param sentences: Sentences
+        :param danmu: Danmu
+        :param dialogue: Dialogue between them, or None for no links
+        :param sources: list of (input file, time offset) the tables came from
+        """
+        data = cls.__new__(cls)
+        data.sources = list(sources)
+        data.sentences = sentences
+        data.danmu = danmu
+        data._setup(dialogue)
+        return data
+
+    def _setup(self, dialogue=None, timeline=True):
+        # mask of the danmu a filter shows, by position, or None to show every danmu
+        self.danmu_filter = None
+        self.timeline = None
+        if timeline:
+            self.mk_timeline()
+
+        # ms the danmu are shifted by against the sentences, on top of their own times
+        self.danmu_shift = 0
+        # metadata of the project the data was opened from, or None
+        self.project = None
+        # history and future hold groups of Edit, undone and redone together
         self.history = []
-        self.dialogue = scipy.sparse.lil_matrix((len(self.sentences), len(self.danmu)), dtype=np.int8)
+        self.future = []
+        self._group = None
+        # Journal every edit, undo and redo is appended to, or None
+        self.journal = None
+        # SearchIndex following every edit of the texts, or None
+        self.search = None
+        self.dialogue = dialogue if dialogue is not None else Dialogue((len(self.sentences), len(self.danmu)))
         # streamer: the streamer of which the sender is a fan
         # fan_name: the name of fans of the streamer
         # fan_level: the level of fans
@@ -70,68 +258,159 @@ class Data:
         return self.dialogue[item]
 
     def mk_timeline(self):
+        self.timeline = Timeline(self.sentences.data, self.danmu.data)
+        for side, table in enumerate((self.sentences, self.danmu)):
+            self.timeline.hide(side, table.data.index.to_numpy()[~table.alive])
+        self.filter_danmu(self.danmu_filter)
 
-        d = []
-        for t_title, data, k in [('start', self.sentences.data, 0), ('end', self.sentences.data, 0), ('time', self.danmu.data, 1)]:
-            t = data.loc[:, t_title].to_numpy()
-            id = data.index.to_numpy()
-            s = np.ones_like(id) * k
-            d.append(np.stack([id, t, s]).T)
-
-        df = np.concatenate(d, axis=0)
+    def filter_danmu(self, mask):
+        """
+        Show only the danmu where mask is True in the timeline; deleted danmu stay hidden either way
 
-        self.timeline = pd.DataFrame(df, columns=["idx", "time", "side"]).sort_values(['time', 'idx'],
-                                                                                      ascending=[True, True])
+        :param mask: boolean array by position in the danmu, or None to show every danmu
+        """
+        self.danmu_filter = mask
+        self.timeline.filter(1, self.danmu.data.index.to_numpy()[~mask] if mask is not None else [])
+
+    def shift_danmu(self, t):
+        if not t:
+            return
+        self.danmu.shift(t)
+        self.danmu_shift += t
+        if self.timeline is not None:
+            self.mk_timeline()
 
     def delete(self, where, idx: int or (int, int)):
-        if where == "sentence":
-            self.sentences.delete(idx)
-            self.history.append(("sentence", "delete"))
-            self.mk_timeline()
-        elif where == "danmu":
-            self.danmu.delete(idx)
-            self.history.append(("danmu", "delete"))
-            self.mk_timeline()
+        if where == "sentence" or where == "danmu":
+            self._do(Edit(where, "delete", idx, True, False))
         else:
-            self.dialogue[idx[0], idx[1]] = 0
-            self.history.append(("dialogue", ("delete", idx)))
+            self._do(Edit("dialogue", "delete", tuple(idx), 1, 0))
 
     def modify(self, where, idx: int or (int, int), content):
         if where == "sentence":
-            self.sentences.modify(idx, content)
-            self.history.append(("sentence", "modify"))
+            self._do(Edit(where, "modify", idx, self.sentences.data.loc[idx, 'content'], content))
         elif where == "danmu":
-            self.danmu.modify(idx, content)
-            self.history.append(("danmu", "modify"))
+            self._do(Edit(where, "modify", idx, self.danmu.data.loc[idx, 'content'], content))
         else:
             raise
 
     def match(self, l_idx, r_idx):
-        self.dialogue[l_idx, r_idx] = 1
-        self.history.append(("dialogue", ("match", (l_idx, r_idx))))
+        self._do(Edit("dialogue", "match", (l_idx, r_idx), 0, 1))
+
+    @contextmanager
+    def group(self):
+        """
+        Edits made inside the context are undone and redone as one entry of the history
+        """
+        if self._group is not None:
+            yield
+            return
+
+        self._group = []
+        try:
+            yield
+        finally:
+            if self._group:
+                self.history.append(self._group)
+                self._log("do", self._group)
+            self._group = None
 
     def undo(self):
-        where, action = self.history[-1]
-        if where == "sentence":
-            out = self.sentences.undo()
-        elif where == "danmu":
-            out = self.danmu.undo()
+        """
+        :return: list of the undone Edit, empty if there is nothing to undo
+        """
+        if not self.history:
+            return []
+        edits = self.history.pop(-1)
+        for edit in reversed(edits):
+            self._apply(edit, edit.before)
+        self.future.append(edits)
+        self._log("undo")
+        return edits
+
+    def redo(self):
+        """
+        :return: list of the redone Edit, empty if there is nothing to redo
+        """
+        if not self.future:
+            return []
+        edits = self.future.pop(-1)
+        for edit in edits:
+            self._apply(edit, edit.after)
+        self.history.append(edits)
+        self._log("redo")
+        return edits
+
+    def _do(self, edit):
+        self._apply(edit, edit.after)
+        if self._group is not None:
+            self._group.append(edit)
+        else:
+            self.history.append([edit])
+            self._log("do", [edit])
+        self.future.clear()
+
+    def _log(self, op, edits=()):
+        if self.journal is not None:
+            self.journal.append(op, edits)
+
+    def replay(self, op, edits=()):
+        """
+        Repeat one entry of a journal
+
+        :param op: "do", "undo" or "redo"
+        :param edits: the group of Edit done by "do"
+        """
+        if op == "do":
+            for edit in edits:
+                self._apply(edit, edit.after)
+            self.history.append(list(edits))
+            self.future.clear()
+        elif op == "undo":
+            self.undo()
+        elif op == "redo":
+            self.redo()
         else:
-            action, idx = action
-            if action == "delete" or action == "match":
-                self.parent.match.match(idx[0], idx[1])
-                self.history.pop(-1)
+            raise
+
+    def load_history(self, history, future):
+        """
+        Bring the data to the state reached by history from the inputs, keeping future to be redone. The current
+        history is undone first, so it may be any history of the same inputs.
+        """
+        for edits in reversed(self.history):
+            for edit in reversed(edits):
+                self._apply(edit, edit.before)
+        self.history = []
+        for edits in history:
+            self.replay("do", edits)
+        self.future = [list(edits) for edits in future]
+
+    def _apply(self, edit, value):
+        if edit.where == "dialogue":
+            self.dialogue[edit.idx] = value
+            return
+
+        side = 0 if edit.where == "sentence" else 1
+        table = self.danmu if side else self.sentences
+        if edit.action == "delete":
+            if value:
+                table.restore(edit.idx)
+                self.timeline.show(side, edit.idx)
             else:
-                raise
-            out = None
-        self.history.pop(-1)
-        self.mk_timeline()
-        return out
+                table.delete(edit.idx)
+                self.timeline.hide(side, edit.idx)
+        elif edit.action == "modify":
+            table.modify(edit.idx, value)
+        else:
+            raise
+        if self.search is not None:
+            self.search.update(edit.where, edit.idx)
 
     def data_to_save(self):
         sentence = self.sentences.data_to_save()
         danmu = self.danmu.data_to_save()
-        return self.dialogue, sentence, danmu
+        return self.dialogue.tolil(), sentence, danmu
 
     def save(self, filepath):
         self.sentences.save(filepath)
@@ -139,18 +418,192 @@ class Data:
         self.dialogue
 
 
-class Sentences:
-    def __init__(self, sen_dir, sen_txt_file):
+class Dialogue:
+    def __init__(self, shape):
+        """
+        Links between sentences and danmu, indexed from both sides so degrees and neighbors are O(1) lookups
+
+        :param shape: (number of sentences, number of danmu)
+        """
+        self.shape = shape
+        # sentence idx -> set of linked danmu idx, and danmu idx -> set of linked sentence idx
+        self.left = {}
+        self.right = {}
+        self.nnz = 0
+
+    def __getitem__(self, item):
+        l_idx, r_idx = item
+        return int(r_idx in self.left.get(l_idx, ()))
+
+    def __setitem__(self, item, value):
+        if value:
+            self.add(*item)
+        else:
+            self.remove(*item)
 
-        self.data = pd.read_csv(sen_txt_file, header=None, names=["start", "end", "content"], index_col=0)
+    def __len__(self):
+        return self.nnz
+
+    def add(self, l_idx, r_idx):
+        danmu = self.left.setdefault(l_idx, set())
+        if r_idx not in danmu:
+            danmu.add(r_idx)
+            self.right.setdefault(r_idx, set()).add(l_idx)
+            self.nnz += 1
+
+    def remove(self, l_idx, r_idx):
+        danmu = self.left.get(l_idx)
+        if danmu and r_idx in danmu:
+            danmu.remove(r_idx)
+            self.right[r_idx].remove(l_idx)
+            if not danmu:
+                del self.left[l_idx]
+            if not self.right[r_idx]:
+                del self.right[r_idx]
+            self.nnz -= 1
+
+    def neighbors(self, side, idx):
+        """
+        :param side: 0 for a sentence, 1 for a danmu
+        :return: set of the idx linked to it on the other side
+        """
+        return (self.right if side else self.left).get(idx, set())
 
-        self.data.insert(3, "wav_file", self.data.apply(_wav_full_name(sen_dir), axis=1), True)
+    def degree(self, side, idx):
+        return len(self.neighbors(side, idx))
+
+    def nonzero(self):
+        """
+        :return: sentence idx and danmu idx of every link, sorted by sentence then danmu
+        """
+        if not self.nnz:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows = np.fromiter((l for l, danmu in self.left.items() for _ in danmu), dtype=np.int64, count=self.nnz)
+        cols = np.fromiter((r for danmu in self.left.values() for r in danmu), dtype=np.int64, count=self.nnz)
+        order = np.lexsort((cols, rows))
+        return rows[order], cols[order]
+
+    def tocoo(self):
+        from scipy import sparse
+
+        rows, cols = self.nonzero()
+        return sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=self.shape)
+
+    def tocsr(self):
+        return self.tocoo().tocsr()
+
+    def tolil(self):
+        return self.tocoo().tolil()
+
+    @classmethod
+    def from_coo(cls, rows, cols, shape):
+        dialogue = cls(shape)
+        for l_idx, r_idx in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist()):
+            dialogue.add(l_idx, r_idx)
+        return dialogue
+
+
+class Timeline:
+    def __init__(self, sentences, danmu):
+        """
+        Start and end of every sentence and time of every danmu, sorted by time then idx. The order is built once;
+        deleting and restoring rows only flips their events in the visibility mask.
+
+        :param sentences: DataFrame with start and end columns
+        :param danmu: DataFrame with a time column
+        """
+        n_sen = len(sentences)
+        idx = np.concatenate([sentences.index.to_numpy(), sentences.index.to_numpy(), danmu.index.to_numpy()])
+        t = np.concatenate([sentences["start"].to_numpy(), sentences["end"].to_numpy(), danmu["time"].to_numpy()])
+        side = np.repeat(np.array([0, 0, 1], dtype=np.int64), [n_sen, n_sen, len(danmu)])
+        end = np.repeat(np.array([False, True, False]), [n_sen, n_sen, len(danmu)])
+        order = np.lexsort((idx, t))
+
+        self.idx = idx[order].astype(np.int64)
+        self.time = t[order].astype(np.int64)
+        self.side = side[order]
+        # True for the end events of sentences
+        self.end = end[order]
+        self.visible = np.ones(len(order), dtype=bool)
+        # False for the events a filter hides, kept apart from visible so filtering never restores deleted rows
+        self.passed = np.ones(len(order), dtype=bool)
+
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        # positions of the events of each row, looked up by side and idx
+        self.positions = [np.full((_size(sentences.index), 2), -1, dtype=np.int64),
+                          np.full((_size(danmu.index), 1), -1, dtype=np.int64)]
+        self.positions[0][sentences.index.to_numpy()] = np.stack([rank[:n_sen], rank[n_sen:2*n_sen]], axis=1)
+        self.positions[1][danmu.index.to_numpy(), 0] = rank[2*n_sen:]
+
+    def __len__(self):
+        return int(self.shown().sum())
+
+    def shown(self):
+        """
+        :return: mask of the events shown, neither deleted nor filtered out
+        """
+        return self.visible & self.passed
+
+    def filter(self, side, idx):
+        """
+        Filter out the rows idx of side, in place of the rows of side filtered out before
+        """
+        self.passed[self.side == side] = True
+        self.passed[self.positions[side][idx]] = False
+
+    def hide(self, side, idx):
+        self.visible[self.positions[side][idx]] = False
+
+    def show(self, side, idx):
+        self.visible[self.positions[side][idx]] = True
+
+    def frame(self):
+        """
+        :return: DataFrame of the shown events with columns idx, time and side
+        """
+        mask = self.shown()
+        return pd.DataFrame({"idx": self.idx[mask], "time": self.time[mask], "side": self.side[mask]})
+
+
+def _size(index):
+    return int(index.max()) + 1 if len(index) else 0
+
+
+class Sentences:
+    def __init__(self, sen_dir=None, sen_txt_file=None, data=None, cache=None):
+        """
+        :param sen_dir: directory of splitted sentences, or the .wav file of the whole session
+        :param sen_txt_file: file path to the transcripted senteces
+        :param data: already loaded sentences, used instead of reading sen_txt_file
+        :param cache: ParseCache of sen_txt_file, or None
+        """
+        if data is None:
+            data = _with_audio(_read_csv(sen_txt_file, SENTENCE_COLUMNS, cache), sen_dir)
+        self.data = data
         # self.shift(-self.data.iloc[0, 0])
+        # deleted rows stay in data, flagged False here by position, until they are saved
+        self.alive = np.ones(len(self.data), dtype=bool)
 
-        self.history = []
+    @classmethod
+    def merge(cls, sentences, ts):
+        """
+        :param sentences: list of Sentences, each sorted by start time
+        :param ts: time offset of each Sentences
+        :return: Sentences sorted by start time and indexed from 0
+        """
+        for s, t in zip(sentences, ts):
+            s.shift(t)
+        data, order = _merge_sorted([s.data for s in sentences], "start")
+        alive = np.concatenate([s.alive for s in sentences])[order]
+        for s, t in zip(sentences, ts):
+            s.shift(-t)
+        merged = cls(data=data)
+        merged.alive = alive
+        return merged
 
     def __len__(self):
-        return self.data.index.max()+1
+        return _size(self.data.index)
 
     def shift(self, t):
         self.data.iloc[:, 0] += t
@@ -159,53 +612,109 @@ class Sentences:
     def append(self, sentences, t):
         sentences.shift(t)
         self.data = pd.concat([self.data, sentences.data], ignore_index=True)
+        self.alive = np.concatenate([self.alive, sentences.alive])
         sentences.shift(-t)
 
     def delete(self, idx):
-        self.history.append(("delete", self.data.loc[idx]))
-        self.data = self.data.drop(idx)
+        self.alive[self.data.index.get_loc(idx)] = False
+
+    def restore(self, idx):
+        self.alive[self.data.index.get_loc(idx)] = True
 
     def modify(self, idx, content):
-        self.history.append(("modify", (idx, self.data.loc[idx, 'content'])))
         self.data.loc[idx, 'content'] = content
 
-    def undo(self):
-        action, content = self.history[-1]
-
-        if action == "delete":
-            self.data.loc[content.name] = content
-            self.data = self.data.sort_index()
-            out = content
-        elif action == "modify":
-            idx, content = content
-            self.data.loc[idx, 'content'] = content
-            out = (idx, content)
-        else:
-            raise
+    def capture(self):
+        """
+        Copy the parts of the table that edits change, cheap enough to do on the UI thread
 
-        self.history.pop(-1)
-        return out
+        :return: callable returning (data, alive) as they are now, safe to call from another thread while edits go on
+        """
+        data, alive, content = self.data, self.alive.copy(), self.data["content"].to_numpy(copy=True)
+        return lambda: (data.assign(content=content), alive)
 
     def data_to_save(self):
-        return self.data
+        return self.data[self.alive]
 
     def save(self, file_path):
-        self.data.to_csv(file_path, header=True, index=True)
+        self.data_to_save().to_csv(file_path, header=True, index=True)
 
 
 class Danmu:
-    def __init__(self, danmu_file):
-        self.data = pd.read_csv(danmu_file, header=None,
-                                names=["time", "streamer", "fan_name", "fan_level", "username", "content"], index_col=0)
-        self.data.iloc[:, 0] = self.data.iloc[:, 0].apply(_time_convert)
-        self.t0 = self.data.iloc[0, 0] * 1000
-        self.shift(-self.data.iloc[0, 0])
-        self.data.iloc[:, 0] *= 1000
+    def __init__(self, danmu_file=None, time_zone=None, data=None, t0=None, cache=None):
+        """
+        :param danmu_file: file path to the danmu file
+        :param time_zone: time zone the danmu times are recorded in; None for the local time zone
+        :param data: already loaded danmu, used instead of reading danmu_file
+        :param t0: unix time in ms of the first danmu of data
+        :param cache: ParseCache of danmu_file, or None
+        """
+        if data is None:
+            def convert(data):
+                timed = _timed(data["time"])
+                if not timed.all():
+                    data = data[timed].copy()
+                data["time"] = _series_time_convert(data["time"], time_zone)
+                return data
+
+            self.data = _read_csv(danmu_file, DANMU_COLUMNS, cache, convert, time_zone)
+            self.t0 = self.data.iloc[0, 0] * 1000
+            self.shift(-self.data.iloc[0, 0])
+            self.data.iloc[:, 0] *= 1000
+        else:
+            self.data = data
+            self.t0 = t0
+        # deleted rows stay in data, flagged False here by position, until they are saved
+        self.alive = np.ones(len(self.data), dtype=bool)
 
-        self.history = []
+    @classmethod
+    def read_span(cls, danmu_file, lo, hi, time_zone=None):
+        """
+        Read the danmu sent from lo to hi, seeking to them with the time index of the file instead of parsing the
+        rows before them
+
+        :param lo: unix time in ms
+        :param hi: unix time in ms, excluded
+        :return: (Danmu timed as one read from the whole file, number of danmu of the file sent before lo)
+        """
+        index = TimeIndex.load(danmu_file, DANMU_TIME_FORMAT)
+        times = _series_time_convert(pd.Series(index.times), time_zone).to_numpy() * 1000
+        t0 = int(times[0]) if len(times) else None
+        start, stop, row = index.span(times, lo, hi)
+
+        with open(danmu_file, "rb") as file:
+            file.seek(start)
+            chunk = file.read(stop - start)
+        if chunk.strip():
+            data = pd.read_csv(io.BytesIO(chunk), header=None, names=DANMU_COLUMNS, index_col=0)
+            data = data[_timed(data["time"])]
+            ms = _series_time_convert(data["time"], time_zone).to_numpy() * 1000
+        else:
+            data = pd.DataFrame(columns=DANMU_COLUMNS)
+            ms = np.empty(0, dtype=np.int64)
+        keep = (ms >= lo) & (ms < hi)
+        danmu = cls(data=data[keep].assign(time=ms[keep] - (t0 or 0)), t0=t0)
+        return danmu, row + int((ms < lo).sum())
+
+    @classmethod
+    def merge(cls, danmu, ts):
+        """
+        :param danmu: list of Danmu, each sorted by time
+        :param ts: time offset of each Danmu
+        :return: Danmu sorted by time and indexed from 0, starting at the t0 of the first Danmu
+        """
+        for d, t in zip(danmu, ts):
+            d.shift(t)
+        data, order = _merge_sorted([d.data for d in danmu], "time")
+        alive = np.concatenate([d.alive for d in danmu])[order]
+        for d, t in zip(danmu, ts):
+            d.shift(-t)
+        merged = cls(data=data, t0=danmu[0].t0)
+        merged.alive = alive
+        return merged
 
     def __len__(self):
-        return self.data.index.max()+1
+        return _size(self.data.index)
 
     def shift(self, t):
         self.data.iloc[:, 0] += t
@@ -213,38 +722,32 @@ class Danmu:
     def append(self, danmu, t):
         danmu.shift(t)
         self.data = pd.concat([self.data, danmu.data], ignore_index=True)
+        self.alive = np.concatenate([self.alive, danmu.alive])
         danmu.shift(-t)
 
     def delete(self, idx):
-        self.history.append(("delete", self.data.loc[idx]))
-        self.data = self.data.drop(idx)
+        self.alive[self.data.index.get_loc(idx)] = False
+
+    def restore(self, idx):
+        self.alive[self.data.index.get_loc(idx)] = True
 
     def modify(self, idx, content):
-        self.history.append(("modify", (idx, self.data.loc[idx, 'content'])))
         self.data.loc[idx, 'content'] = content
 
-    def undo(self):
-        action, content = self.history[-1]
-
-        if action == "delete":
-            self.data.loc[content.name] = content
-            self.data = self.data.sort_index()
-            out = content
-        elif action == "modify":
-            idx, content = content
-            self.data.loc[idx, 'content'] = content
-            out = (idx, content)
-        else:
-            raise
+    def capture(self):
+        """
+        Copy the parts of the table that edits change, cheap enough to do on the UI thread
 
-        self.history.pop(-1)
-        return out
+        :return: callable returning (data, alive) as they are now, safe to call from another thread while edits go on
+        """
+        data, alive, content = self.data, self.alive.copy(), self.data["content"].to_numpy(copy=True)
+        return lambda: (data.assign(content=content), alive)
 
     def data_to_save(self):
-        return self.data
+        return self.data[self.alive]
 
     def save(self, file_path):
-        self.data.to_csv(file_path, header=True, index=True)
+        self.data_to_save().to_csv(file_path, header=True, index=True)
 
 
 if __name__ == "__main__":
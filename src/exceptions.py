@@ -29,3 +29,11 @@ class StartTimeFormatIncorrect(TimeFormatIncorrect):
 
 class TimeZoneCodeFormatIncorrect(TimeFormatIncorrect):
     pass
+
+
+class ProjectFormatError(Exception):
+    pass
+
+
+class WindowFormatIncorrect(TimeFormatIncorrect):
+    pass
@@ -0,0 +1,113 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMATS = ("jsonl", "csv")
+CHUNK_SIZE = 10000
+
+
+def export_format(file_path):
+    """
+    :return: "jsonl" or "csv", from the suffix of file_path
+    """
+    fmt = os.path.splitext(str(file_path))[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"can not export to .{fmt}, use one of {FORMATS}")
+    return fmt
+
+
+def capture(data, session=None):
+    """
+    Copy what an export needs of data, cheap enough to do on the UI thread
+
+    :param data: Data to export
+    :param session: name of the session written in every record
+    :return: generator function of the record chunks, safe to run on another thread while edits go on
+    """
+    sentences = data.sentences.capture()
+    danmu = data.danmu.capture()
+    rows, cols = data.dialogue.nonzero()
+    t0, shift = data.danmu.t0, data.danmu_shift
+
+    def chunks(chunk_size=CHUNK_SIZE):
+        return _chunks(sentences(), danmu(), rows, cols, t0, shift, session, chunk_size)
+
+    return chunks
+
+
+def _chunks(sentences, danmu, rows, cols, t0, shift, session, chunk_size):
+    """
+    Records of the links between alive rows, chunk_size links at a time
+    """
+    (sen, sen_alive), (dan, dan_alive) = sentences, danmu
+    for begin in range(0, len(rows), chunk_size):
+        sen_pos = sen.index.get_indexer(rows[begin:begin + chunk_size])
+        dan_pos = dan.index.get_indexer(cols[begin:begin + chunk_size])
+        keep = (sen_pos >= 0) & (dan_pos >= 0)
+        keep[keep] = sen_alive[sen_pos[keep]] & dan_alive[dan_pos[keep]]
+        if not keep.any():
+            continue
+        s = sen.iloc[sen_pos[keep]]
+        d = dan.iloc[dan_pos[keep]]
+
+        time = d["time"].to_numpy()
+        chunk = pd.DataFrame({
+            "session": session,
+            "sentence_idx": s.index.to_numpy(),
+            "sentence_start": s["start"].to_numpy(),
+            "sentence_end": s["end"].to_numpy(),
+            "sentence": s["content"].to_numpy(),
+            "danmu_idx": d.index.to_numpy(),
+            "danmu_time": time,
+            # unix time in ms the danmu was sent at, before the danmu were shifted against the sentences
+            "danmu_timestamp": time - shift + t0 if t0 is not None else np.nan,
+            "danmu": d["content"].to_numpy(),
+            "streamer": d["streamer"].to_numpy(),
+            "fan_name": d["fan_name"].to_numpy(),
+            "fan_level": d["fan_level"].to_numpy(),
+            "username": d["username"].to_numpy(),
+            # ms from the end of the sentence to the danmu, negative for danmu sent while it is spoken
+            "latency": time - s["end"].to_numpy(),
+        })
+        yield chunk
+
+
+def write_chunks(chunks, file, fmt):
+    """
+    :param chunks: iterable of record DataFrames
+    :param file: text file opened for writing
+    :param fmt: "jsonl" or "csv"
+    :return: number of records written
+    """
+    n = 0
+    header = True
+    for chunk in chunks:
+        if fmt == "jsonl":
+            file.write(chunk.to_json(orient="records", lines=True, force_ascii=False))
+        else:
+            chunk.to_csv(file, header=header, index=False, lineterminator="\n")
+            header = False
+        n += len(chunk)
+    return n
+
+
+def write_export(chunks, file_path, chunk_size=CHUNK_SIZE):
+    """
+    :param chunks: generator function returned by capture
+    :param file_path: the .jsonl or .csv file
+    :return: number of records written
+    """
+    fmt = export_format(file_path)
+    with open(file_path, "w", encoding="utf-8", newline="") as file:
+        return write_chunks(chunks(chunk_size), file, fmt)
+
+
+def export_pairs(data, file_path, session=None, chunk_size=CHUNK_SIZE):
+    """
+    Write the matched sentence and danmu pairs of data to a .jsonl or .csv file
+
+    :return: number of records written
+    """
+    return write_export(capture(data, session), file_path, chunk_size)
+
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# metadata columns of the danmu filtered by their value
+CATEGORIES = ("streamer", "fan_name", "username")
+
+
+class DanmuFilter:
+    def __init__(self, danmu):
+        """
+        Filters of the danmu by their metadata. The categorical columns are coded once, so filtering by a set of values
+        is a lookup of every code in a table of the allowed codes, and filters combine as boolean masks.
+
+        :param danmu: Danmu; its rows may be deleted and restored, but not added
+        """
+        self.n = len(danmu.data)
+        self.codes = {}
+        self.categories = {}
+        for column in CATEGORIES:
+            # missing values are coded -1
+            self.codes[column], self.categories[column] = pd.factorize(danmu.data[column], sort=True)
+        self.fan_level = pd.to_numeric(danmu.data["fan_level"], errors="coerce").fillna(0).to_numpy()
+
+    def values(self, column):
+        """
+        :return: sorted list of the values of a categorical column
+        """
+        return self.categories[column].tolist()
+
+    def isin(self, column, values):
+        """
+        :return: mask of the danmu whose column is one of values
+        """
+        codes = self.categories[column].get_indexer(list(values))
+        # the extra last entry is looked up by the missing values
+        allowed = np.zeros(len(self.categories[column]) + 1, dtype=bool)
+        allowed[codes[codes >= 0]] = True
+        return allowed[self.codes[column]]
+
+    def mask(self, streamers=(), fan_names=(), min_level=0, hidden_users=()):
+        """
+        :param streamers: show only the danmu sent in the rooms of these streamers; empty for every room
+        :param fan_names: show only the fans of these fan clubs; empty for every danmu
+        :param min_level: show only the fans of at least this level
+        :param hidden_users: hide the danmu of these users
+        :return: mask of the danmu passing every filter, by position, or None if no filter is set
+        """
+        if not (streamers or fan_names or min_level or hidden_users):
+            return None
+        mask = np.ones(self.n, dtype=bool)
+        if streamers:
+            mask &= self.isin("streamer", streamers)
+        if fan_names:
+            mask &= self.isin("fan_name", fan_names)
+        if min_level:
+            mask &= self.fan_level >= min_level
+        if hidden_users:
+            mask &= ~self.isin("username", hidden_users)
+        return mask
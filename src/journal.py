@@ -0,0 +1,348 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .project import json_default, encode_edits, decode_edits, write_atomic, capture
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+JOURNAL_VERSION = 1
+AUTOSAVE_DIR = Path.home() / ".psr_datalabeler" / "autosave"
+
+
+def session_key(sources):
+    """
+    :param sources: list of (input file, time offset), as Data.sources
+    :return: key of a labeling session, changes with the paths, sizes, mtimes and offsets of its inputs
+    """
+    ident = [JOURNAL_VERSION]
+    for file_path, t in sources:
+        stat = os.stat(file_path)
+        ident.append([os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, int(t)])
+    return hashlib.sha1(json.dumps(ident).encode("utf-8")).hexdigest()
+
+
+def _try_lock(file):
+    """
+    Lock an open file against every other open of it, in this process or another, without waiting. The lock goes
+    away with the file or the process, even one that crashes.
+
+    :return: whether the file is locked
+    """
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class Journal:
+    def __init__(self, file_path, header):
+        """
+        Append only log of the edits, undos and redos of a session, one json line each. The first line is the
+        header, entry 0.
+
+        :param file_path: the journal file, appended to if it exists
+        :param header: dict written as the header of a new journal
+        """
+        self.file_path = Path(file_path)
+        _, entries, length = self._scan(file_path)
+        self.seq = max((seq for seq, _, _ in entries), default=0)
+        self._lock = threading.Lock()
+        exists = self.file_path.exists()
+        if exists and self.file_path.stat().st_size > length:
+            # a line torn by a crash, the next entry would be glued onto it
+            os.truncate(self.file_path, length)
+        self._file = open(self.file_path, "a", encoding="utf-8")
+        if not exists:
+            self._write([0, "header", header])
+
+    @staticmethod
+    def _scan(file_path):
+        """
+        :return: (header, entries, length), length the size in bytes of the complete lines read
+        """
+        header = None
+        entries = []
+        length = 0
+        try:
+            with open(file_path, "rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        seq, op, edits = json.loads(line)
+                    except ValueError:
+                        break
+                    if seq == 0:
+                        header = edits
+                    else:
+                        entries.append((seq, op, decode_edits(edits)))
+                    length += len(line)
+        except FileNotFoundError:
+            pass
+        return header, entries, length
+
+    @staticmethod
+    def read(file_path):
+        """
+        :return: (header, entries), entries a list of (seq, op, edits); a last line torn by a crash is left out
+        """
+        header, entries, _ = Journal._scan(file_path)
+        return header, entries
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, default=json_default) + "\n")
+        self._file.flush()
+
+    def append(self, op, edits=()):
+        with self._lock:
+            self.seq += 1
+            self._write([self.seq, op, encode_edits(edits)])
+
+    def compact(self, seq):
+        """
+        Drop the entries up to seq, once a snapshot holds them
+        """
+        with self._lock:
+            self._file.close()
+            try:
+                kept = []
+                for line in self.file_path.read_text(encoding="utf-8").splitlines(keepends=True):
+                    try:
+                        entry_seq = json.loads(line)[0]
+                    except ValueError:
+                        continue
+                    if line.endswith("\n") and 0 < entry_seq <= seq:
+                        continue
+                    kept.append(line)
+                write_atomic(self.file_path, lambda file: file.write("".join(kept).encode("utf-8")))
+            finally:
+                self._file = open(self.file_path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Autosave:
+    def __init__(self, data, root=None):
+        """
+        Keeps a labeling session safe from crashes. Every edit goes to a journal as it is made, snapshots of the
+        history are written in the background and compact the journal, and saving the project never blocks the caller.
+
+        A run that does not continue an earlier one starts a lineage. The run holds a lock next to its journal while
+        it writes to it, and removes the journal and snapshot when it closes. So a journal found unlocked was left by
+        a run which crashed, and is offered to be replayed on the data it started from, or on a project saved from
+        it; a journal still locked belongs to a run going on, which another run never writes to.
+
+        :param data: Data of the session
+        :param root: directory of the journals and snapshots; defaults to $PSR_AUTOSAVE_DIR or ~/.psr_datalabeler/autosave
+        """
+        self.data = data
+        self.root = Path(root or os.environ.get("PSR_AUTOSAVE_DIR") or AUTOSAVE_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        project = data.project
+        self.key = project["session"] if project and "session" in project else session_key(data.sources)
+        # lineage and seq of the state the data was opened in
+        self.base = [project.get("lineage"), project.get("seq", 0)] if project else [None, 0]
+
+        self.lineage = None
+        self.journal = None
+        # the open lock file of the lineage, while this run holds it
+        self._lock = None
+        self.snapshot_seq = 0
+        self._executor = ThreadPoolExecutor(1)
+        self._closed = False
+
+    def journal_path(self, lineage):
+        return self.root / f"{self.key}-{lineage}.journal"
+
+    def snapshot_path(self, lineage):
+        return self.root / f"{self.key}-{lineage}.snapshot"
+
+    def lock_path(self, lineage):
+        return self.root / f"{self.key}-{lineage}.lock"
+
+    def _acquire(self, lineage):
+        """
+        :return: whether this run now holds the lock of lineage, which no other run does
+        """
+        file = open(self.lock_path(lineage), "a+")
+        if not _try_lock(file):
+            file.close()
+            return False
+        self._lock = file
+        return True
+
+    def _release(self):
+        if self._lock is None:
+            return
+        self._lock.close()
+        self._lock = None
+        try:
+            os.remove(self.lock_path(self.lineage))
+        except OSError:
+            # another run locked it meanwhile
+            pass
+
+    def _find(self):
+        """
+        :return: (header, entries, seq) of the newest journal continuing the data which no run holds, seq being where
+            the data is in its lineage, or None; its lineage is locked for this run
+        """
+        same, forks = [], []
+        journals = sorted(self.root.glob(f"{self.key}-*.journal"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for journal_path in journals:
+            header, entries = Journal.read(journal_path)
+            if header is None:
+                continue
+            if header["lineage"] == self.base[0]:
+                same.append((header, entries, self.base[1]))
+            elif header["origin"] == self.base:
+                forks.append((header, entries, 0))
+        for found in same + forks:
+            if self._acquire(found[0]["lineage"]):
+                return found
+        return None
+
+    def _discard(self):
+        for file_path in (self.journal_path(self.lineage), self.snapshot_path(self.lineage)):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def recover(self, confirm=None):
+        """
+        Replay the snapshot and journal left by an earlier run continuing the data which crashed, then start
+        journaling
+
+        :param confirm: callable returning whether to replay the journal found, called only if one is found; None to
+            replay it without asking. A journal not replayed is removed.
+        :return: number of journal entries replayed
+        """
+        found = self._find()
+        if found is not None and confirm is not None and not confirm():
+            self.lineage = found[0]["lineage"]
+            self._discard()
+            self._release()
+            found = None
+        if found is None:
+            header, entries, seq = {"lineage": uuid.uuid4().hex, "origin": self.base}, [], 0
+            self._acquire(header["lineage"])
+        else:
+            header, entries, seq = found
+        self.lineage = header["lineage"]
+
+        try:
+            with open(self.snapshot_path(self.lineage), encoding="utf-8") as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            snapshot = None
+        if snapshot is not None and snapshot["seq"] > seq:
+            self.data.load_history([decode_edits(edits) for edits in snapshot["history"]],
+                                   [decode_edits(edits) for edits in snapshot["future"]])
+            seq = snapshot["seq"]
+        self.snapshot_seq = seq
+
+        replayed = 0
+        for entry_seq, op, edits in entries:
+            if entry_seq > seq:
+                self.data.replay(op, edits)
+                replayed += 1
+
+        self.journal = Journal(self.journal_path(self.lineage), header)
+        self.journal.seq = max(self.journal.seq, seq)
+        self.data.journal = self.journal
+        return replayed
+
+    def dirty(self):
+        return not self._closed and self.journal is not None and self.journal.seq > self.snapshot_seq
+
+    def snapshot(self):
+        """
+        Write the history in the background and compact the journal with it; nothing is done if it has not changed
+        """
+        if not self.dirty():
+            return None
+        seq = self.journal.seq
+        snapshot = {"version": JOURNAL_VERSION, "seq": seq,
+                    "history": [encode_edits(edits) for edits in self.data.history],
+                    "future": [encode_edits(edits) for edits in self.data.future]}
+        snapshot_path = self.snapshot_path(self.lineage)
+        self.snapshot_seq = seq
+
+        def write():
+            try:
+                text = json.dumps(snapshot, default=json_default)
+                write_atomic(snapshot_path, lambda file: file.write(text.encode("utf-8")))
+                self.journal.compact(seq)
+            except (OSError, ValueError) as err:
+                # the journal still holds every entry
+                print(err)
+
+        return self._executor.submit(write)
+
+    def save(self, file_path):
+        """
+        Save the project to file_path in the background
+
+        :return: Future of the write, None once closed
+        """
+        if self._closed:
+            return None
+        seq = self.journal.seq if self.journal is not None else 0
+        write_project = capture(self.data, session=self.key, lineage=self.lineage, seq=seq)
+
+        def write():
+            try:
+                write_project(file_path)
+            except Exception as err:
+                print(err)
+
+        return self._executor.submit(write)
+
+    def submit(self, fn, *args):
+        """
+        Run fn on the writer thread, after the saves submitted before it
+
+        :return: Future of fn, None once closed
+        """
+        if self._closed:
+            return None
+
+        def run():
+            try:
+                return fn(*args)
+            except Exception as err:
+                print(err)
+
+        return self._executor.submit(run)
+
+    def close(self):
+        """
+        Finish the pending writes and stop journaling. The journal and snapshot are removed, the edits not saved
+        being given up by closing, so they are never replayed on the next run.
+        """
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        if self.journal is None:
+            return
+        self.data.journal = None
+        self.journal.close()
+        self._discard()
+        self._release()
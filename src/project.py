@@ -0,0 +1,174 @@
+import os
+import json
+import pickle
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .data import Data, Dialogue, Sentences, Danmu, Edit
+from .columnar import frame_to_arrays, arrays_to_frame
+from .exceptions import ProjectFormatError
+
+PROJECT_VERSION = 1
+ALIVE = "__alive__"
+
+
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value)} can not be stored as json")
+
+
+def encode_edits(edits):
+    return [list(edit) for edit in edits]
+
+
+def decode_edits(records):
+    edits = []
+    for where, action, idx, before, after in records:
+        if where == "dialogue":
+            idx = tuple(idx)
+        edits.append(Edit(where, action, idx, before, after))
+    return edits
+
+
+def write_atomic(file_path, write):
+    """
+    Write a file through a temporary one next to it, so a crash never leaves it half written
+
+    :param write: callable writing the content to the binary file it is given
+    """
+    tmp = f"{file_path}.tmp"
+    with open(tmp, "wb") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, file_path)
+
+
+def capture(data, **meta):
+    """
+    Copy what a project holds of data, cheap enough to do on the UI thread
+
+    :param data: Data to save
+    :param meta: more session metadata to store
+    :return: callable writing the project to the file path it is given, safe to call from another thread while edits
+        go on
+    """
+    sentences = data.sentences.capture()
+    danmu = data.danmu.capture()
+    rows, cols = data.dialogue.nonzero()
+    meta = {"version": PROJECT_VERSION,
+            "sources": [[os.path.abspath(file_path), t] for file_path, t in data.sources],
+            "danmu_shift": data.danmu_shift,
+            "t0": data.danmu.t0,
+            "shape": list(data.dialogue.shape),
+            "history": [encode_edits(edits) for edits in data.history],
+            "future": [encode_edits(edits) for edits in data.future],
+            **meta}
+
+    def write(file_path):
+        arrays = {"dialogue/rows": rows, "dialogue/cols": cols}
+        for name, table in (("sentences", sentences), ("danmu", danmu)):
+            frame, alive = table()
+            meta[f"{name}_columns"] = list(frame.columns)
+            arrays.update({f"{name}/{key}": array for key, array in frame_to_arrays(frame).items()})
+            arrays[f"{name}/{ALIVE}"] = alive
+        arrays["meta"] = np.frombuffer(json.dumps(meta, default=json_default).encode("utf-8"), dtype=np.uint8)
+        write_atomic(file_path, lambda file: np.savez(file, **arrays))
+
+    return write
+
+
+def save_project(data, file_path, **meta):
+    capture(data, **meta)(file_path)
+
+
+def load_project(file_path):
+    """
+    :param file_path: a project, or a .psr pickle of the first versions
+    :return: Data of the project, with its metadata in Data.project
+    """
+    if not zipfile.is_zipfile(file_path):
+        return _load_pickle(file_path)
+
+    with np.load(file_path, allow_pickle=False) as npz:
+        try:
+            meta = json.loads(npz["meta"].tobytes().decode("utf-8"))
+        except (KeyError, ValueError):
+            raise ProjectFormatError(f"{file_path} is not a project")
+        if meta.get("version", 0) > PROJECT_VERSION:
+            raise ProjectFormatError(f"{file_path} needs a newer version, project version {meta['version']}")
+
+        tables = {}
+        for name in ("sentences", "danmu"):
+            prefix = f"{name}/"
+            arrays = {key[len(prefix):]: npz[key] for key in npz.files if key.startswith(prefix)}
+            tables[name] = (arrays_to_frame(arrays, meta[f"{name}_columns"]), arrays[ALIVE])
+        rows, cols = npz["dialogue/rows"], npz["dialogue/cols"]
+
+    sentences = Sentences(data=tables["sentences"][0])
+    sentences.alive = tables["sentences"][1]
+    danmu = Danmu(data=tables["danmu"][0], t0=meta["t0"])
+    danmu.alive = tables["danmu"][1]
+    dialogue = Dialogue.from_coo(rows, cols, tuple(meta["shape"]))
+
+    data = Data.from_tables(sentences, danmu, dialogue, [tuple(source) for source in meta["sources"]])
+    data.danmu_shift = meta["danmu_shift"]
+    data.history = [decode_edits(edits) for edits in meta["history"]]
+    data.future = [decode_edits(edits) for edits in meta["future"]]
+    data.project = meta
+    return data
+
+
+def _load_pickle(file_path):
+    """
+    The first .psr files pickled (dialogue, sentences, danmu) with the deleted rows left out, and nothing else
+    """
+    try:
+        with open(file_path, "rb") as file:
+            dialogue, sentences, danmu = pickle.load(file)
+    except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        raise ProjectFormatError(f"{file_path} is not a project")
+
+    dialogue = dialogue.tocoo()
+    return Data.from_tables(Sentences(data=sentences), Danmu(data=danmu),
+                            Dialogue.from_coo(dialogue.row, dialogue.col, dialogue.shape), [(file_path, 0)])
+
+
+def apply_labels(data, labels):
+    """
+    Make the edits that bring data, freshly loaded from the inputs of a project, to the labels of the project: the
+    deleted rows, modified contents and dialogue links. They are done as one group of the history.
+
+    :param data: Data
+    :param labels: Data of the project, from load_project
+    """
+    with data.group():
+        for where, table, other in (("sentence", data.sentences, labels.sentences),
+                                    ("danmu", data.danmu, labels.danmu)):
+            index = table.data.index
+            pos = other.data.index.get_indexer(index)
+            present = pos >= 0
+            # rows left out of a pickled project were deleted
+            kept = np.zeros(len(index), dtype=bool)
+            kept[present] = other.alive[pos[present]]
+            for idx in index[table.alive & ~kept].tolist():
+                data.delete(where, idx)
+
+            mine = table.data["content"].to_numpy()[present]
+            theirs = other.data["content"].to_numpy()[pos[present]]
+            changed = ~((mine == theirs) | (pd.isna(mine) & pd.isna(theirs)))
+            for idx, content in zip(index[present][changed].tolist(), theirs[changed]):
+                data.modify(where, idx, content)
+
+        rows, cols = labels.dialogue.nonzero()
+        links = set(zip(rows.tolist(), cols.tolist()))
+        rows, cols = data.dialogue.nonzero()
+        for link in zip(rows.tolist(), cols.tolist()):
+            if link not in links:
+                data.delete("dialogue", link)
+        for l_idx, r_idx in sorted(links):
+            if not data.dialogue[l_idx, r_idx]:
+                data.match(l_idx, r_idx)
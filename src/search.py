@@ -0,0 +1,144 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .text import CODE_BITS, codepoints
+
+# (where, column) of the searched text columns; where as in Data.modify
+FIELDS = (("sentence", "content"), ("danmu", "content"), ("danmu", "username"))
+
+
+def _normalize(text):
+    return text.lower() if isinstance(text, str) else None
+
+
+def _bigrams(texts):
+    """
+    Bigrams of the lower cased texts. The last character of a text pairs with 0, so every character starts a bigram.
+
+    :return: (owner, codes) as char_ngrams
+    """
+    cps, starts, lengths = codepoints(texts, lower=True)
+    following = np.append(cps[1:], 0)
+    following[(starts + lengths - 1)[lengths > 0]] = 0
+    return np.repeat(np.arange(len(lengths)), lengths), ((cps + 1) << CODE_BITS) + following
+
+
+class _Postings:
+    def __init__(self, texts, index):
+        """
+        Inverted index of the bigrams of one column
+
+        :param texts: text of each row; None for a row left out
+        :param index: idx of each row
+        """
+        owner, codes = _bigrams(texts)
+        # a stable sort keeps the rows of each bigram in order
+        order = np.argsort(codes, kind="stable")
+        codes = codes[order]
+        first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.empty(0, dtype=np.int64)
+        self.vocab = codes[first]
+        self.offsets = np.append(first, len(codes))
+        self.rows = owner[order].astype(np.int32)
+        self.index = index
+
+    def lookup(self, lo, hi):
+        """
+        :return: sorted unique positions of the rows with a bigram code in [lo, hi)
+        """
+        a, b = np.searchsorted(self.vocab, [lo, hi])
+        rows = self.rows[self.offsets[a]:self.offsets[b]]
+        if b - a > 1:
+            return np.unique(rows)
+        # the rows of one bigram are sorted already, but repeat where it occurs more than once in a text
+        return rows[np.r_[True, rows[1:] != rows[:-1]]] if len(rows) else rows
+
+
+class SearchIndex:
+    def __init__(self, data, wait=True):
+        """
+        Inverted index of character bigrams of the text columns of data. Edits made after it is created are kept
+        aside and searched directly, so the index never has to be rebuilt.
+
+        :param data: Data of the session; the index registers itself as data.search to follow its edits
+        :param wait: build the index before returning; otherwise it is built on another thread, and the first search
+            waits for it
+        """
+        self.data = data
+        # idx -> lower cased text, or None if deleted, of the rows edited after the index was made, by field
+        self.edited = {field: {} for field in FIELDS}
+        self.postings = {}
+
+        columns = {}
+        for where, column in FIELDS:
+            table = self.table(where)
+            texts = table.data[column].to_numpy(copy=True)
+            texts[~table.alive] = None
+            columns[where, column] = texts, table.data.index.to_numpy()
+        data.search = self
+
+        if wait:
+            self._build(columns)
+            self._built = None
+        else:
+            executor = ThreadPoolExecutor(1)
+            self._built = executor.submit(self._build, columns)
+            executor.shutdown(wait=False)
+
+    def _build(self, columns):
+        for field, (texts, index) in columns.items():
+            self.postings[field] = _Postings(texts, index)
+
+    def table(self, where):
+        return self.data.danmu if where == "danmu" else self.data.sentences
+
+    def update(self, where, idx):
+        """
+        Follow an edit of row idx, called by Data as the edit is applied
+        """
+        table = self.table(where)
+        alive = table.alive[table.data.index.get_loc(idx)]
+        for field in FIELDS:
+            if field[0] == where:
+                self.edited[field][idx] = _normalize(table.data.loc[idx, field[1]]) if alive else None
+
+    def search(self, query):
+        """
+        :param query: text to look for, case insensitive
+        :return: dict of (where, column) to the sorted idx of the alive rows containing query
+        """
+        if self._built is not None:
+            self._built.result()
+            self._built = None
+        query = _normalize(query)
+        return {field: self._search(field, query) for field in FIELDS}
+
+    def _search(self, field, query):
+        postings = self.postings[field]
+        if not query:
+            return np.empty(0, dtype=np.int64)
+
+        if len(query) == 1:
+            # every bigram starting with the character
+            code = (ord(query) + 1) << CODE_BITS
+            pos = postings.lookup(code, code + (1 << CODE_BITS))
+        else:
+            pos = None
+            _, codes = _bigrams([query])
+            # the last bigram is the end of the query against the NUL, which a match need not have
+            for code in np.unique(codes[:-1]):
+                rows = postings.lookup(code, code + 1)
+                pos = rows if pos is None else np.intersect1d(pos, rows, assume_unique=True)
+                if not len(pos):
+                    break
+            if len(query) > 2 and len(pos):
+                texts = self.table(field[0]).data[field[1]].to_numpy()[pos]
+                pos = pos[np.array([isinstance(text, str) and query in text.lower() for text in texts], dtype=bool)]
+
+        idx = postings.index[pos]
+        edited = self.edited[field]
+        if edited:
+            idx = idx[~np.isin(idx, np.fromiter(edited, dtype=np.int64, count=len(edited)))]
+            found = [i for i, text in edited.items() if text is not None and query in text]
+            idx = np.union1d(idx, np.asarray(found, dtype=np.int64))
+        return idx
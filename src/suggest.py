@@ -0,0 +1,113 @@
+import numpy as np
+
+from .text import ngram_matrix
+
+# ms after the end of a sentence that replies to it are looked for in
+WINDOW = 10000
+TOP = 5
+# pairs scored at a time, bounding the memory of the sparse products
+CHUNK_SIZE = 200000
+
+
+class Suggester:
+    def __init__(self, data, after=WINDOW, before=0, top=TOP):
+        """
+        Suggests the danmu a sentence is likely matched with: the danmu sent from before ms before its end to after ms
+        after it, ranked by the cosine similarity of their character unigrams and bigrams with the sentence, then by
+        how soon they follow it. Danmu already linked to the sentence, deleted rows and danmu hidden by the filter of
+        data are never suggested.
+
+        :param data: Data of the session; suggestions follow its edits
+        :param top: number of danmu suggested for each sentence
+        """
+        self.data = data
+        self.after = after
+        self.before = before
+        self.top = top
+
+    def candidates(self, sen_idx):
+        """
+        :param sen_idx: array of alive sentence idx
+        :return: (sen_idx, dan_idx) of every pair of a sentence and an alive danmu shown by the filter in its window,
+            grouped by sentence
+        """
+        sentences = self.data.sentences.data
+        danmu = self.data.danmu.data
+        alive = self.data.danmu.alive
+        if self.data.danmu_filter is not None:
+            alive = alive & self.data.danmu_filter
+        # danmu are sorted by time
+        times = danmu["time"].to_numpy()[alive]
+        dan_alive = danmu.index.to_numpy()[alive]
+
+        end = sentences["end"].to_numpy()[sentences.index.get_indexer(sen_idx)]
+        lo = np.searchsorted(times, end - self.before, side="left")
+        hi = np.searchsorted(times, end + self.after, side="right")
+        counts = np.maximum(hi - lo, 0)
+        total = int(counts.sum())
+        offsets = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        return np.repeat(sen_idx, counts), dan_alive[np.arange(total) + offsets]
+
+    def score(self, sen_idx, dan_idx):
+        """
+        :return: cosine similarity of the character n-grams of each pair of a sentence and a danmu
+        """
+        sentences = self.data.sentences.data["content"]
+        danmu = self.data.danmu.data["content"]
+        sen_rows, sen_unique = _factorize(sen_idx)
+        dan_rows, dan_unique = _factorize(dan_idx)
+        matrix = ngram_matrix(list(sentences.loc[sen_unique]) + list(danmu.loc[dan_unique]))
+
+        scores = np.empty(len(sen_idx))
+        for begin in range(0, len(sen_idx), CHUNK_SIZE):
+            end = begin + CHUNK_SIZE
+            product = matrix[sen_rows[begin:end]].multiply(matrix[dan_rows[begin:end] + len(sen_unique)])
+            scores[begin:end] = np.asarray(product.sum(axis=1)).ravel()
+        return scores
+
+    def rank(self, sen_idx=None):
+        """
+        :param sen_idx: sentence idx to rank the danmu of; None for every alive sentence
+        :return: (sen_idx, dan_idx, score) of the suggestions, the best first for each sentence
+        """
+        sentences = self.data.sentences
+        if sen_idx is None:
+            sen_idx = sentences.data.index.to_numpy()[sentences.alive]
+        else:
+            sen_idx = np.asarray(sen_idx, dtype=np.int64)
+            sen_idx = sen_idx[sentences.alive[sentences.data.index.get_indexer(sen_idx)]]
+        rows, cols = self.candidates(sen_idx)
+
+        # only the links of the ranked sentences are looked up, so ranking one sentence does not walk every link
+        dialogue = self.data.dialogue
+        links = [(l_idx, r_idx) for l_idx in np.unique(rows).tolist() for r_idx in dialogue.neighbors(0, l_idx)]
+        if links:
+            link_rows, link_cols = np.array(links, dtype=np.int64).T
+            width = max(int(cols.max()), int(link_cols.max())) + 1
+            keep = ~np.isin(rows * width + cols, link_rows * width + link_cols)
+            rows, cols = rows[keep], cols[keep]
+
+        scores = self.score(rows, cols)
+        # candidates of a sentence come in time order, so a stable sort keeps the sooner of equal scores first
+        order = np.lexsort((-scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+        rank = np.arange(len(rows)) - np.repeat(first, np.diff(np.r_[first, len(rows)]))
+        keep = rank < self.top
+        return rows[keep], cols[keep], scores[keep]
+
+    def suggest(self, idx):
+        """
+        :param idx: sentence idx
+        :return: list of the danmu idx suggested for the sentence, the best first
+        """
+        _, cols, _ = self.rank([idx])
+        return cols.tolist()
+
+
+def _factorize(idx):
+    """
+    :return: position of each idx in the unique idx, and the unique idx
+    """
+    unique, rows = np.unique(idx, return_inverse=True)
+    return rows, unique
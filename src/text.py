@@ -0,0 +1,65 @@
+import numpy as np
+
+# code points are below 2 ** 21, so up to three of them pack into one int64 n-gram code
+CODE_BITS = 21
+
+
+def codepoints(texts, lower=False):
+    """
+    :param texts: sequence of str; missing values count as empty
+    :param lower: lower case the texts
+    :return: (cps, starts, lengths)
+        cps: int64 code points of all the texts joined
+        starts: position of each text in cps
+        lengths: number of code points of each text
+    """
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    joined = "".join(texts)
+    if lower:
+        lowered = joined.lower()
+        # a few characters lower to more than one, moving the texts after them
+        if len(lowered) != len(joined):
+            texts = [text.lower() for text in texts]
+            lowered = "".join(texts)
+        joined = lowered
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    cps = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    starts = np.cumsum(lengths) - lengths
+    return cps, starts, lengths
+
+
+def char_ngrams(texts, n=2):
+    """
+    Every character n-gram of every text, found without a python loop over the characters
+
+    :param n: 1, 2 or 3
+    :return: (owner, codes): position of the text each n-gram is in, and the n-gram packed into an int64. Codes of
+        different n never collide.
+    """
+    cps, starts, lengths = codepoints(texts)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    first = np.arange(max(len(cps) - n + 1, 0))
+    # n-grams may not run past the end of their text
+    first = first[first - starts[owner[first]] + n <= lengths[owner[first]]]
+
+    codes = np.zeros(len(first), dtype=np.int64)
+    for k in range(n):
+        codes = (codes << CODE_BITS) + cps[first + k] + (1 if k < n - 1 else 0)
+    return owner[first], codes
+
+
+def ngram_matrix(texts, ns=(1, 2)):
+    """
+    :return: csr matrix of the L2 normalized character n-gram counts of the texts, one row each
+    """
+    from scipy import sparse
+
+    owners, codes = zip(*(char_ngrams(texts, n) for n in ns))
+    owner = np.concatenate(owners)
+    vocab, columns = np.unique(np.concatenate(codes), return_inverse=True)
+    matrix = sparse.csr_matrix((np.ones(len(owner)), (owner, columns)), shape=(len(texts), len(vocab)))
+    matrix.sum_duplicates()
+    norm = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norm[norm == 0] = 1
+    return sparse.diags(1 / norm) @ matrix
+
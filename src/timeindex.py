@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+TIME_INDEX_VERSION = 4
+# seconds between the rows a time index records
+INTERVAL = 10
+# bytes scanned at a time while building a time index
+BLOCK_BYTES = 16 * 1024 ** 2
+# longest time field looked for, in bytes
+MAX_TIME_WIDTH = 32
+# longest row looked for, in bytes; a quote keeping a row open longer is stray
+MAX_ROW_BYTES = 1024 ** 2
+
+
+def sidecar_path(file_path):
+    return f"{file_path}.tidx"
+
+
+def _unquoted(buf, ends):
+    """
+    :param buf: bytes starting at a row, as uint8
+    :param ends: positions of the line breaks in buf
+    :return: mask of the line breaks outside quoted fields, which end rows
+    """
+    quotes = np.flatnonzero(buf == ord('"'))
+    if not len(quotes):
+        return np.ones(len(ends), dtype=bool)
+    # a run of quotes opens or closes a field only at an edge of the field, and only if it is odd, an escaped quote
+    # being doubled; a quote inside an unquoted field, as in a"b, is a character
+    run = np.r_[True, np.diff(quotes) != 1]
+    first, last = quotes[run], quotes[np.r_[run[1:], True]]
+    before = np.where(first > 0, buf[np.maximum(first - 1, 0)], ord("\n"))
+    after = np.where(last + 1 < len(buf), buf[np.minimum(last + 1, len(buf) - 1)], ord("\n"))
+    edge = np.isin(before, (ord(","), ord("\n"))) | np.isin(after, (ord(","), ord("\n"), ord("\r")))
+    toggles = first[edge & ((last - first) % 2 == 0)]
+    return np.searchsorted(toggles, ends) % 2 == 0
+
+
+class TimeIndex:
+    def __init__(self, offsets, rows, times, size, mtime_ns):
+        """
+        Byte offsets of the first row of every INTERVAL seconds of a danmu csv sorted by time, so the rows of a time
+        span are read without parsing the rows before them
+
+        :param offsets: byte offset of each recorded row
+        :param rows: number of rows of the file before each recorded row, counting only the rows whose time parses
+        :param times: time field of each recorded row, as written in the csv
+        :param size: size of the csv the index was built from
+        :param mtime_ns: mtime of the csv the index was built from
+        """
+        self.offsets = offsets
+        self.rows = rows
+        self.times = times
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def load(cls, file_path, time_format):
+        """
+        :param file_path: the danmu csv
+        :param time_format: strptime format of its time field
+        :return: the index stored next to file_path, or one built by scanning the file and stored there if there is
+            none or the file changed since
+        """
+        stat = os.stat(file_path)
+        try:
+            with np.load(sidecar_path(file_path)) as npz:
+                meta = npz["meta"].tolist()
+                if meta == [TIME_INDEX_VERSION, stat.st_size, stat.st_mtime_ns, INTERVAL]:
+                    return cls(npz["offsets"], npz["rows"], npz["times"], stat.st_size, stat.st_mtime_ns)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(file_path, time_format)
+        try:
+            index.save(sidecar_path(file_path))
+        except OSError:
+            # the directory of the csv is not writable; the index is built again next time
+            pass
+        return index
+
+    @classmethod
+    def build(cls, file_path, time_format):
+        """
+        Scan file_path block by block, finding the rows and their time fields with vectorized byte searches. Only
+        the bytes present when the scan starts are indexed, so a file still being written to can be indexed. A line
+        break inside a quoted field does not end a row, and rows whose time field does not parse are neither recorded
+        nor counted, as Danmu leaves them out.
+        """
+        stat = os.stat(file_path)
+        offsets, rows, times = [], [], []
+        n_rows = 0
+        last_bucket = None
+        base = 0
+        carry = b""
+        with open(file_path, "rb") as file:
+            remaining = stat.st_size
+            while remaining > 0 or carry:
+                chunk = file.read(min(BLOCK_BYTES, remaining)) if remaining > 0 else b""
+                remaining -= len(chunk)
+                block = carry + chunk
+                if remaining <= 0 and not block.endswith(b"\n"):
+                    # the last row may have no line break
+                    block += b"\n"
+                buf = np.frombuffer(block, dtype=np.uint8)
+                all_ends = np.flatnonzero(buf == ord("\n"))
+                ends = all_ends[_unquoted(buf, all_ends)]
+                if not len(ends) and len(block) > MAX_ROW_BYTES:
+                    # no row is that long, the quote keeping it open is stray
+                    ends = all_ends
+                if remaining <= 0 and (not len(ends) or ends[-1] != len(buf) - 1):
+                    # the file ends inside a quoted field, what is left is its last row
+                    ends = np.r_[ends, len(buf) - 1]
+                complete = int(ends[-1]) + 1 if len(ends) else 0
+                carry = block[complete:]
+                if not complete:
+                    continue
+
+                starts = np.r_[0, ends[:-1] + 1]
+                commas = np.flatnonzero(buf[:complete] == ord(","))
+                # the time is the field between the first two commas of a row, after its index
+                i = np.searchsorted(commas, starts)
+                valid = i + 1 < len(commas)
+                i = np.minimum(i, max(len(commas) - 2, 0))
+                first, second = (commas[i], commas[i + 1]) if len(commas) > 1 else (starts, starts)
+                valid &= second < ends
+                starts, first, second = starts[valid], first[valid], second[valid]
+
+                if len(starts):
+                    width = min(int((second - first - 1).max()), MAX_TIME_WIDTH)
+                    cols = first[:, None] + 1 + np.arange(width)
+                    chars = buf[np.minimum(cols, complete - 1)]
+                    chars[cols >= second[:, None]] = 0
+                    fields = np.ascontiguousarray(chars).view(f"S{width}").ravel()
+
+                    uniques, codes = np.unique(fields, return_inverse=True)
+                    strings = np.char.strip(uniques.astype(str), '"')
+                    parsed = pd.to_datetime(strings, format=time_format, errors="coerce")
+                    timed = np.flatnonzero(~parsed.isna()[codes])
+                    bucket = (parsed.asi8 // 10 ** 9 // INTERVAL)[codes[timed]]
+                    if len(bucket):
+                        # positions among the timed rows of the rows starting a new bucket
+                        first = np.flatnonzero(np.r_[bucket[0] != last_bucket, bucket[1:] != bucket[:-1]])
+                        new = timed[first]
+                        offsets.append(base + starts[new])
+                        rows.append(n_rows + first)
+                        times.append(strings[codes[new]])
+                        last_bucket = bucket[-1]
+                    n_rows += len(timed)
+                base += complete
+
+        def concat(arrays, dtype):
+            return np.concatenate(arrays) if arrays else np.empty(0, dtype=dtype)
+
+        return cls(concat(offsets, np.int64), concat(rows, np.int64), concat(times, str),
+                   stat.st_size, stat.st_mtime_ns)
+
+    def save(self, file_path):
+        from .project import write_atomic
+
+        meta = np.array([TIME_INDEX_VERSION, self.size, self.mtime_ns, INTERVAL], dtype=np.int64)
+        write_atomic(file_path, lambda file: np.savez(file, meta=meta, offsets=self.offsets, rows=self.rows,
+                                                       times=self.times))
+
+    def span(self, times, lo, hi):
+        """
+        :param times: the recorded times converted to unix ms
+        :return: (start, stop, row): byte range holding every row timed from lo to hi, and the number of rows before
+            start
+        """
+        first = max(int(np.searchsorted(times, lo, side="right")) - 1, 0)
+        last = int(np.searchsorted(times, hi, side="left"))
+        start = int(self.offsets[first]) if len(self.offsets) else 0
+        stop = int(self.offsets[last]) if last < len(self.offsets) else self.size
+        row = int(self.rows[first]) if len(self.rows) else 0
+        return start, max(stop, start), row
@@ -1,23 +1,36 @@
 import re
 import os
+import enum
 import sys
-import time
-import pickle
-import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import numpy as np
-from PyQt5 import QtWidgets, QtGui, QtMultimedia, QtCore
-from PyQt5.QtWidgets import QPushButton, QApplication, QVBoxLayout, QWidget, QHBoxLayout, QLabel, QGridLayout
+from PyQt5 import QtWidgets, QtGui, QtCore
+from PyQt5.QtWidgets import QPushButton, QApplication, QVBoxLayout, QWidget, QHBoxLayout, QLabel
 from PyQt5.QtCore import Qt, pyqtSignal, QPoint
 
-from .data import Data
 from .exceptions import *
 
+# numpy, pandas and the modules built on them are imported where they are first needed, so the launcher shows up
+# without waiting for them
+if TYPE_CHECKING:
+    from .data import Data
+
 ORIGIN = {"border": "1px solid black", "padding": "3px", "background-color": "#FFFFFF"}
 UNMARKED = {"border": "1px solid black", "padding": "3px", "background-color": "#FFFFFF"}
 MARKED = {"border": "1px solid #C13434", "padding": "3px", "background-color": "#FFFFFF"}
 CHOSEN = {"border": "1px solid #D7E9FF", "padding": "3px", "background-color": "#D7E9FF"}
+SUGGESTED = {"border": "1px dashed #2E8B57", "padding": "3px", "background-color": "#FFFFFF"}
+FOUND = {"border": "1px solid black", "padding": "3px", "background-color": "#FFF3B0"}
+
+ROW_HEIGHT = 40
+SPACING = 80
+# sentences within this many rows of the view have their audio decoded ahead of time
+PREFETCH_ROWS = 50
+# ms between snapshots of the edit history
+AUTOSAVE_INTERVAL = 30000
+# distance from the edge of a Label to its text box, the margins of its two layouts
+TEXT_MARGIN = 20
 
 
 def check_file(file_path, required_type=".csv"):
@@ -49,17 +62,6 @@ def check_file(file_path, required_type=".csv"):
         return -1
 
 
-def time_stamp(t, time_zone):
-    """
-
-    :param t: YYYYMMDD-hhmmss
-    :param time_zone: UTC n
-    :return:
-    """
-    ts = int(time.mktime(datetime.datetime.strptime(t, "%Y%m%d-%H%M%S").timetuple())) - int(time_zone.split()[1]) * 3600
-    return ts*1000
-
-
 def style_2_stylesheet(style):
     return "; ".join([f"{k}: {style[k]}" for k in style])
 
@@ -68,25 +70,61 @@ def stylesheet_2_style(style_sheet):
     return {k.strip().split(":")[0].strip() : k.strip().split(":")[1].strip() for k in style_sheet.split(";")}
 
 
+class LabelState(enum.IntFlag):
+    NONE = 0
+    MARKED = 1
+    CHOSEN = 2
+    SUGGESTED = 4
+    FOUND = 8
+
+
+def state_style(state):
+    """
+    :return: style of a label in state; the background shows whether it is chosen, else whether it is found by a
+        search, and the border whether it is marked, else whether it is suggested
+    """
+    if state & LabelState.CHOSEN:
+        style = dict(CHOSEN)
+    elif state & LabelState.FOUND:
+        style = dict(FOUND)
+    else:
+        style = dict(UNMARKED)
+    if state & LabelState.MARKED:
+        style["border"] = MARKED["border"]
+    elif state & LabelState.SUGGESTED:
+        style["border"] = SUGGESTED["border"]
+    return style
+
+
+# stylesheet of every LabelState, built once so changing state never parses or formats css
+STYLESHEETS = {LabelState(state): style_2_stylesheet(state_style(LabelState(state))) for state in range(16)}
+
+
 class Matching:
     def __init__(self, data, window):
         self.data = data
         self.window = window
+        # idx of the marked sentence and the marked danmu
         self.left = None
         self.right = None
+        # danmu idx suggested for the marked sentence, the best first
+        self.suggested = []
 
         self.click = None
         self.rest = None
 
-    def clicking(self, side_label, label):
-        if side_label:
-            if side_label.idx == label.idx:
-                side_label.set_unmarked()
+    def clicking(self, side, marked, label):
+        if marked is not None:
+            self.unmark(side, marked)
+            if marked == label.idx:
                 return None
-            else:
-                side_label.set_unmarked()
 
-        return label
+        return label.idx
+
+    def unmark(self, side, idx):
+        label = self.window.label(side, idx)
+        if label:
+            label.set_unmarked()
 
     def on_click(self, side, label):
         """
@@ -95,11 +133,11 @@ class Matching:
         """
 
         if side == 0:
-            self.left = self.clicking(self.left, label)
+            self.left = self.clicking(0, self.left, label)
             self.rest = self.right
             # print(self.left)
         elif side == 1:
-            self.right = self.clicking(self.right, label)
+            self.right = self.clicking(1, self.right, label)
             self.rest = self.left
             # print(self.right)
         else:
@@ -110,12 +148,12 @@ class Matching:
         left = None
         right = None
 
-        if self.rest:
+        if self.left is not None and self.right is not None:
             paired = 1
-            self.left.set_unmarked()
-            self.right.set_unmarked()
+            self.unmark(0, self.left)
+            self.unmark(1, self.right)
 
-            out = self.match(self.left.idx, self.right.idx)
+            out = self.match(self.left, self.right)
 
             left = self.left
             right = self.right
@@ -124,56 +162,57 @@ class Matching:
             self.right = None
             self.rest = None
 
+        if side == 0 or paired:
+            self.window.show_suggestions(self.left)
         return paired, out, left, right
 
     def match(self, l_idx, r_idx):
         if self.data[l_idx, r_idx]:
             self.data.delete("dialogue", (l_idx, r_idx))
-            if self.window.dialogue_show:
-                if (self.data.dialogue[l_idx, :] != 0).count_nonzero() == 0:
-                    self.window.sen_labels[l_idx][0].set_unchosen()
-                else:
-                    self.window.sen_labels[l_idx][0].set_chosen()
-                if (self.data.dialogue[:, r_idx] != 0).count_nonzero() == 0:
-                    self.window.dan_labels[r_idx][0].set_unchosen()
-                else:
-                    self.window.dan_labels[r_idx][0].set_chosen()
             out = 0
         else:
             self.data.match(l_idx, r_idx)
-            if self.window.dialogue_show:
-                self.window.sen_labels[l_idx][0].set_chosen()
-                self.window.dan_labels[r_idx][0].set_chosen()
             out = 1
+        self.update_labels(l_idx, r_idx)
+        self.window.container.invalidate_links()
         return out
 
+    def update_labels(self, l_idx, r_idx):
+        for side, idx in ((0, l_idx), (1, r_idx)):
+            label = self.window.label(side, idx)
+            if label:
+                label.update_style()
+
 
 class Label(QWidget):
     clicked = pyqtSignal()  # Define a signal for label click
 
     def __init__(self, idx, side, parent=None, match=None):
-        super().__init__()
+        super().__init__(parent.container)
         self.selected = False
+        self.chosen = False
+        self.suggested = False
+        self.found = False
+        self.state = LabelState.NONE
         self.is_editing = False
         self.side = side
         self.idx = idx
         self.match = match
         self.parent = parent
 
-        data = self.match.data.danmu.data if side else self.match.data.sentences.data
-        text = data.loc[idx, "content"]
-
         self.layout = QHBoxLayout(self)
+        self.layout.setSpacing(0)
+        self.layout.setContentsMargins(10, 0, 10, 0)
 
         self.text_widget = QWidget(self)
         self.text_layout = QVBoxLayout(self.text_widget)
         self.text_layout.setSpacing(0)
         self.text_layout.setContentsMargins(10, 0, 10, 0)
 
-        self.label = QLabel(text=text, parent=self)
+        self.label = QLabel(parent=self)
         self.label.setWordWrap(True)
         self.label.setAlignment(Qt.AlignCenter)
-        self.label.setStyleSheet(style_2_stylesheet(ORIGIN))
+        self.label.setStyleSheet(STYLESHEETS[self.state])
 
         self.line_edit = QtWidgets.QLineEdit(self)
         self.line_edit.hide()
@@ -195,45 +234,59 @@ class Label(QWidget):
 
         self.layout.addWidget(self.text_widget)
 
-    def set_marked(self):
-        self.selected = True
-        out_ss = MARKED.copy()
+        self.bind(idx)
 
-        ss = stylesheet_2_style(self.label.styleSheet())
-        if "background-color" in ss:
-            bg_value = ss["background-color"]
-        else:
-            bg_value = "#FFFFFF"
-
-        out_ss["background-color"] = bg_value
+    def bind(self, idx):
+        """
+        Show row idx in this label; the view reuses labels for other rows as it scrolls
+        """
+        if self.is_editing:
+            self.finish_editing()
+        self.idx = idx
 
-        self.label.setStyleSheet(style_2_stylesheet(out_ss))
+        data = self.match.data.danmu.data if self.side else self.match.data.sentences.data
+        text = data.loc[idx, "content"]
+        self.label.setText(text if isinstance(text, str) else "")
 
-    def set_unmarked(self):
-        self.selected = False
-        out_ss = UNMARKED.copy()
+        marked = self.match.right if self.side else self.match.left
+        self.selected = marked == idx
+        self.update_style()
 
-        ss = stylesheet_2_style(self.label.styleSheet())
-        if "background-color" in ss:
-            bg_value = ss["background-color"]
-        else:
-            bg_value = "#FFFFFF"
+    def update_style(self):
+        self.chosen = bool(self.parent.dialogue_show and self.match.data.dialogue.degree(self.side, self.idx))
+        self.suggested = bool(self.side) and self.idx in self.match.suggested
+        self.found = self.parent.found == (self.side, self.idx)
+        self.set_state()
 
-        out_ss["background-color"] = bg_value
+    def set_state(self):
+        state = LabelState.NONE
+        if self.selected:
+            state |= LabelState.MARKED
+        if self.chosen:
+            state |= LabelState.CHOSEN
+        if self.suggested:
+            state |= LabelState.SUGGESTED
+        if self.found:
+            state |= LabelState.FOUND
+        if state != self.state:
+            self.state = state
+            self.label.setStyleSheet(STYLESHEETS[state])
 
-        if "background-color" in ss:
-            if ss["background-color"] == CHOSEN["background-color"]:
-                out_ss["border"] = CHOSEN["border"]
+    def set_marked(self):
+        self.selected = True
+        self.set_state()
 
-        self.label.setStyleSheet(style_2_stylesheet(out_ss))
+    def set_unmarked(self):
+        self.selected = False
+        self.set_state()
 
     def set_chosen(self):
-        self.label.setStyleSheet(style_2_stylesheet(CHOSEN))
+        self.chosen = True
+        self.set_state()
 
     def set_unchosen(self):
-        out_ss = UNMARKED.copy()
-        out_ss["background-color"] = "#FFFFFF"
-        self.label.setStyleSheet(style_2_stylesheet(out_ss))
+        self.chosen = False
+        self.set_state()
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -278,6 +331,10 @@ class Label(QWidget):
         # Add actions to the context menu
         context_menu.addAction(action_edit)
         context_menu.addAction(action_delete)
+        if self.side:
+            action_hide = QtWidgets.QAction("hide user", self)
+            action_hide.triggered.connect(self.hide_user)
+            context_menu.addAction(action_hide)
 
         # Show the context menu at the position of the cursor
         context_menu.exec_(event.globalPos())
@@ -307,71 +364,251 @@ class Label(QWidget):
         self.parent.delete(self)
 
     def play_sound(self):
-        sound_file = self.match.data.sentences.data.iloc[self.idx, 3]
-        QtMultimedia.QSound.play(sound_file)
+        self.parent.audio.play(self.idx)
+
+    def hide_user(self):
+        self.parent.hide_user(self.match.data.danmu.data.loc[self.idx, "username"])
+
+
+class TimelineLayout:
+    def __init__(self, timeline):
+        """
+        Rows of the timeline view. Every shown danmu and sentence start takes one row, and a sentence spans the
+        rows up to its end.
+
+        The rows are kept for every event of the timeline, shown or not, in its fixed order, so deleting or
+        restoring a row only shifts the rows after it instead of laying out the timeline again.
+
+        :param timeline: Timeline of the data
+        """
+        import numpy as np
+
+        self.timeline = timeline
+        self.shown = timeline.shown()
+        counted = self.shown & ~timeline.end
+        # number of shown rows before each event, which is the row of the event if it is shown
+        self.before = np.cumsum(counted) - counted
+        self.n_rows = int(counted.sum())
+
+        # positions of the sentence starts and of their ends, in the order of the starts; reach is the running
+        # maximum of the end positions, so the sentences still going on at a position are found by a binary search
+        self._sen_start = np.flatnonzero((timeline.side == 0) & ~timeline.end)
+        self._sen_end = timeline.positions[0][timeline.idx[self._sen_start], 1]
+        self._sen_reach = np.maximum.accumulate(self._sen_end) if len(self._sen_end) else self._sen_end
+
+    def update(self, side, idx):
+        """
+        Follow row idx of side being deleted or restored in the timeline, shifting the rows after it
+        """
+        for pos in self.timeline.positions[side][idx].tolist():
+            shown = bool(self.timeline.visible[pos] and self.timeline.passed[pos])
+            if shown == self.shown[pos]:
+                continue
+            self.shown[pos] = shown
+            if not self.timeline.end[pos]:
+                step = 1 if shown else -1
+                self.before[pos + 1:] += step
+                self.n_rows += step
+
+    def row(self, side, idx):
+        """
+        :return: row of idx of side, an int or an array of them; -1 if not shown
+        """
+        import numpy as np
+
+        pos = self.timeline.positions[side][idx, 0]
+        return np.where(self.shown[pos], self.before[pos], -1)
+
+    def span(self, idx):
+        """
+        :return: number of rows sentence idx spans, an int or an array of them; 0 if not shown
+        """
+        import numpy as np
+
+        start, end = self.timeline.positions[0][idx, 0], self.timeline.positions[0][idx, 1]
+        return np.where(self.shown[start], np.maximum(self.before[end] - self.before[start], 1), 0)
+
+    def sentences_in(self, r0, r1):
+        """
+        :return: idx of the sentences overlapping rows r0 to r1, r1 excluded
+        """
+        import numpy as np
+
+        p0, p1 = np.searchsorted(self.before, [r0, r1])
+        # a sentence before lo neither starts at r0 or later nor ends after r0
+        lo = min(np.searchsorted(self._sen_reach, np.searchsorted(self.before, r0, side="right")),
+                 np.searchsorted(self._sen_start, p0))
+        hi = np.searchsorted(self._sen_start, p1)
+        start, end = self._sen_start[lo:hi], self._sen_end[lo:hi]
+        first = self.before[start]
+        keep = self.shown[start] & (np.maximum(self.before[end], first + 1) > r0)
+        return self.timeline.idx[start[keep]]
+
+    def danmu_in(self, r0, r1):
+        """
+        :return: idx of the danmu in rows r0 to r1, r1 excluded
+        """
+        import numpy as np
+
+        lo, hi = np.searchsorted(self.before, [r0, r1])
+        keep = self.shown[lo:hi] & (self.timeline.side[lo:hi] == 1)
+        return self.timeline.idx[lo:hi][keep]
 
 
 class ContentContainer(QWidget):
     def __init__(self, parent):
         super(ContentContainer, self).__init__(parent=parent)
         self.parent = parent
+        self._pairs = None
+        self._links = None
+
+    def columns(self):
+        """
+        :return: x and width of the sentence column, and x and width of the danmu column
+        """
+        w = max((self.width() - SPACING) // 2, 0)
+        return 0, w, w + SPACING, w
+
+    def offset(self):
+        return self.parent.scroll_bar.value()
+
+    def row_rect(self, side, idx):
+        layout = self.parent.view_layout
+        sen_x, sen_w, dan_x, dan_w = self.columns()
+        y = int(layout.row(side, idx)) * ROW_HEIGHT - self.offset()
+        if side:
+            return QtCore.QRect(dan_x, y, dan_w, ROW_HEIGHT)
+        return QtCore.QRect(sen_x, y, sen_w, int(layout.span(idx)) * ROW_HEIGHT)
+
+    def wheelEvent(self, event):
+        self.parent.scroll_bar.setValue(self.parent.scroll_bar.value() - event.angleDelta().y())
+
+    def resizeEvent(self, event):
+        self.parent.update_scroll_range()
+        self.parent.relayout()
+
+    def invalidate_links(self, pairs=True):
+        """
+        Drop the cached link geometry, when the rows move or the links change
+
+        :param pairs: whether the links changed; False when only the rows moved, keeping the links found
+        """
+        self._links = None
+        if pairs:
+            self._pairs = None
+        self.update()
+
+    def links(self):
+        """
+        :return: (left_y, right_y, reach) of every shown link in content coordinates, sorted by the upper end
+            of the link; reach is the running maximum of the lower end, so the links crossing a band of y are
+            found by two binary searches
+        """
+        import numpy as np
+
+        if self._pairs is None:
+            self._pairs = self.parent.data.dialogue.nonzero()
+        if self._links is None:
+            layout = self.parent.view_layout
+            L, R = self._pairs
+            sen_row, dan_row = layout.row(0, L), layout.row(1, R)
+            shown = (sen_row >= 0) & (dan_row >= 0)
+            left_y = (sen_row * ROW_HEIGHT + layout.span(L) * ROW_HEIGHT // 2)[shown]
+            right_y = (dan_row * ROW_HEIGHT + ROW_HEIGHT // 2)[shown]
+
+            top, bottom = np.minimum(left_y, right_y), np.maximum(left_y, right_y)
+            order = np.argsort(top, kind="stable")
+            left_y, right_y, bottom = left_y[order], right_y[order], bottom[order]
+            reach = np.maximum.accumulate(bottom) if len(bottom) else bottom
+            self._links = (left_y, right_y, top[order], bottom, reach)
+        return self._links
 
     def paintEvent(self, event):
+        import numpy as np
+
         if self.parent.dialogue_show:
             painter = QtGui.QPainter(self)
             pen = QtGui.QPen(QtGui.QColor("#2C6DCD"), 3)
             painter.setPen(pen)
 
-            L, R = self.parent.data.dialogue.nonzero()
+            offset = self.offset()
+            rect = event.rect()
+            y0, y1 = rect.top() + offset, rect.bottom() + offset
+
+            left_y, right_y, top, bottom, reach = self.links()
+            lo = np.searchsorted(reach, y0)
+            hi = np.searchsorted(top, y1, side="right")
+            crossing = bottom[lo:hi] >= y0
+            left_y = (left_y[lo:hi][crossing] - offset).tolist()
+            right_y = (right_y[lo:hi][crossing] - offset).tolist()
 
-            for l_idx, r_idx in zip(L, R):
-                left_label = self.parent.sen_labels[l_idx][0]
-                right_label = self.parent.dan_labels[r_idx][0]
-                left_rect = left_label.label.geometry()
-                right_rect = right_label.label.geometry()
-                left_pos = left_label.mapTo(self, QPoint(left_rect.right(), left_rect.center().y()))
-                right_pos = right_label.mapTo(self, QPoint(right_rect.left(), right_rect.center().y()))
+            sen_x, sen_w, dan_x, _ = self.columns()
+            for ly, ry in zip(left_y, right_y):
+                painter.drawLine(QPoint(sen_x + sen_w - TEXT_MARGIN, ly), QPoint(dan_x + TEXT_MARGIN, ry))
 
-                painter.drawLine(left_pos, right_pos)
+
+def confirm_recover(parent):
+    answer = QtWidgets.QMessageBox.question(parent, "Recover Edits",
+                                            "A run of this session did not close, leaving edits unsaved. "
+                                            "Recover them?")
+    return answer == QtWidgets.QMessageBox.Yes
 
 
 class MainWindow(QWidget):
-    def __init__(self, data: Data, danmu_shift=-20105000, parent=None):
+    def __init__(self, data: "Data", danmu_shift=-20105000, parent=None, session=None):
+        from .audio import AudioService
+        from .journal import Autosave
+        from .search import SearchIndex
+
         super(MainWindow, self).__init__()
         self.parent = parent
         self.data = data
         self.data.parent = self
-        self.data.danmu.shift(danmu_shift)
-        self.data.mk_timeline()
+        # WindowedSession data is a window of, or None
+        self.session = session
+        self.data.shift_danmu(danmu_shift)
 
         self.match = Matching(self.data, self)
+        self.audio = AudioService(self.data.sentences, parent=self)
+        # built when a sentence is first marked
+        self.suggester = None
+        self.search_index = SearchIndex(self.data, wait=False)
+        self.autosave = Autosave(self.data)
+        self.autosave.recover(lambda: confirm_recover(self))
+        self.autosave_timer = QtCore.QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosave.snapshot)
+        self.autosave_timer.start(AUTOSAVE_INTERVAL)
 
         self.w = 1000
         self.h = 1000
         self.dialogue_show = True
         self.file_path = None
+        # (side, idx) of the row the last search jumped to, or None
+        self.found = None
 
         self.resize(self.w, self.h)
         self.setWindowTitle("PSR数据标注器")
 
-        self.connections = {}
+        # labels of the rows in view, by idx, and labels scrolled out of view waiting to be reused
         self.sen_labels = {}
         self.dan_labels = {}
-        self.deleted = [set(), set()]
+        self.label_pool = [[], []]
 
         self.main_layout = QVBoxLayout(self)
         self.setLayout(self.main_layout)
 
         self.container = ContentContainer(self)
-        self.container_layout = QGridLayout(self.container)
+        self.scroll_bar = QtWidgets.QScrollBar(Qt.Vertical)
+        self.scroll_bar.setSingleStep(ROW_HEIGHT)
+        self.scroll_bar.valueChanged.connect(self.relayout)
 
-        self.init_labels()
-
-        self.container.setLayout(self.container_layout)
+        self.c_widget = QWidget()
+        self.c_layout = QHBoxLayout(self.c_widget)
+        self.c_layout.setContentsMargins(0, 0, 0, 0)
+        self.c_layout.addWidget(self.container)
+        self.c_layout.addWidget(self.scroll_bar)
 
-        self.c_widget = QtWidgets.QScrollArea()
-        self.c_widget.setWidgetResizable(True)
-        self.c_widget.setWidget(self.container)
+        self.init_labels()
 
         # Control Panel
 
@@ -387,13 +624,48 @@ class MainWindow(QWidget):
         self.button_save.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
         self.button_save.clicked.connect(self.save)
 
+        self.button_export = QtWidgets.QPushButton("Export Pairs")
+        self.button_export.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
+        self.button_export.clicked.connect(self.export)
+
+        self.button_filter = QtWidgets.QPushButton("Filters")
+        self.button_filter.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
+        self.button_filter.clicked.connect(self.toggle_filters)
+
         self.button_file = QtWidgets.QPushButton("Select File")
         self.button_file.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
         self.button_file.clicked.connect(self.select_file)
 
+        self.search_bar = QtWidgets.QLineEdit()
+        self.search_bar.setPlaceholderText("Search")
+        self.search_bar.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #FFFFFF")
+        self.search_bar.returnPressed.connect(self.find_next)
+        self.search_count = QLabel()
+
         self.cp_layout.addWidget(self.button_show)
         self.cp_layout.addWidget(self.button_save)
+        self.cp_layout.addWidget(self.button_export)
+        self.cp_layout.addWidget(self.button_filter)
         self.cp_layout.addWidget(self.button_file)
+        self.cp_layout.addWidget(self.search_bar)
+        if self.session is not None:
+            self.button_previous = QtWidgets.QPushButton("Previous")
+            self.button_previous.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
+            self.button_previous.clicked.connect(lambda: self.page(-1))
+            self.button_next = QtWidgets.QPushButton("Next")
+            self.button_next.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
+            self.button_next.clicked.connect(lambda: self.page(1))
+            self.cp_layout.addWidget(self.button_previous)
+            self.cp_layout.addWidget(QLabel(self.session.label()))
+            self.cp_layout.addWidget(self.button_next)
+        self.cp_layout.addWidget(self.search_count)
+
+        # Filter panel, built when first opened
+        self.danmu_filter = None
+        self.hidden_users = set()
+        self.filter_panel = QWidget()
+        self.fp_layout = QHBoxLayout(self.filter_panel)
+        self.filter_panel.hide()
 
         # Add shortcuts
         self.save_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+S"), self)
@@ -402,69 +674,245 @@ class MainWindow(QWidget):
         self.save_shortcut.activated.connect(self.save_as)
         self.undo_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Z"), self)
         self.undo_shortcut.activated.connect(self.undo)
+        self.redo_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Y"), self)
+        self.redo_shortcut.activated.connect(self.redo)
+        self.redo_shift_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+Shift+Z"), self)
+        self.redo_shift_shortcut.activated.connect(self.redo)
+        self.accept_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("A"), self)
+        self.accept_shortcut.activated.connect(self.accept_suggestion)
+        self.search_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("Ctrl+F"), self)
+        self.search_shortcut.activated.connect(self.search_bar.setFocus)
+        self.find_shortcut = QtWidgets.QShortcut(QtGui.QKeySequence("F3"), self)
+        self.find_shortcut.activated.connect(self.find_next)
 
         # main
         self.setStyleSheet("background-color: #F8F8F8")
         self.main_layout.addWidget(self.control_panel)
-        self.main_layout.addWidget(self.c_widget)
+        self.main_layout.addWidget(self.filter_panel)
+        self.main_layout.addWidget(self.c_widget, 1)
 
     def init_labels(self):
-        i = 1
-        last_idx = None
-        last_i = 2
+        self.update_layout()
 
-        self.container_layout.addItem(QtWidgets.QSpacerItem(80, 20), 1, 2)
+    def update_scroll_range(self):
+        height = self.container.height()
+        self.scroll_bar.setPageStep(height)
+        self.scroll_bar.setRange(0, max(self.view_layout.n_rows * ROW_HEIGHT - height, 0))
 
-        for _, line in self.data.timeline.iterrows():
-            idx, time, side = line
+    def relayout(self):
+        """
+        Place labels on the rows in view only, reusing the labels of the rows that left it
+        """
+        top = self.scroll_bar.value()
+        r0, r1 = top // ROW_HEIGHT, (top + self.container.height()) // ROW_HEIGHT + 1
+        self.place_labels(0, self.view_layout.sentences_in(r0, r1), self.sen_labels)
+        self.place_labels(1, self.view_layout.danmu_in(r0, r1), self.dan_labels)
+        self.audio.prefetch(self.view_layout.sentences_in(r0 - PREFETCH_ROWS, r1 + PREFETCH_ROWS).tolist())
+        self.container.update()
 
-            label = Label(idx, side, parent=self, match=self.match)
-            label.layout.setSpacing(0)
-            label.layout.setContentsMargins(10, 0, 10, 0)
-            label.label.adjustSize()
+    def place_labels(self, side, idx, labels):
+        idx = idx.tolist()
+        in_view = set(idx)
+        for i in [i for i in labels if i not in in_view]:
+            label = labels.pop(i)
+            label.hide()
+            self.label_pool[side].append(label)
+
+        for i in idx:
+            label = labels.get(i)
+            if label is None:
+                if self.label_pool[side]:
+                    label = self.label_pool[side].pop(-1)
+                    label.bind(i)
+                else:
+                    label = Label(i, side, parent=self, match=self.match)
+                labels[i] = label
+            label.setGeometry(self.container.row_rect(side, i))
+            label.show()
 
-            if side:
-                self.dan_labels[label.idx] = (label, i, side+2)
+    def label(self, side, idx):
+        """
+        :return: the label showing row idx, or None if it is out of view
+        """
+        return (self.dan_labels if side else self.sen_labels).get(idx)
 
-                self.container_layout.addWidget(label, i, side+2)
+    def scroll_to(self, side, idx):
+        """
+        Scroll row idx to the middle of the view and highlight it
+        """
+        row = int(self.view_layout.row(side, idx))
+        if row < 0:
+            return
+        old, self.found = self.found, (side, idx)
+        self.scroll_bar.setValue(row * ROW_HEIGHT - (self.container.height() - ROW_HEIGHT) // 2)
+        for found in (old, self.found):
+            label = self.label(*found) if found else None
+            if label:
+                label.update_style()
+
+    def find_next(self):
+        """
+        Jump to the next row containing the text of the search bar, after the row jumped to last or from the top of
+        the view
+        """
+        import numpy as np
+
+        result = self.search_index.search(self.search_bar.text())
+        sentences = result["sentence", "content"]
+        danmu = np.union1d(result["danmu", "content"], result["danmu", "username"])
+        rows = np.concatenate([self.view_layout.row(0, sentences), self.view_layout.row(1, danmu)])
+        # hits in the order of the view, sentences before danmu on the same row, leaving out filtered danmu
+        keys = rows * 2 + np.repeat([0, 1], [len(sentences), len(danmu)])
+        keys = np.sort(keys[rows >= 0])
+        if not len(keys):
+            self.search_count.setText("0/0")
+            return
 
-            else:
-                if last_idx == idx:
-                    self.sen_labels[label.idx] = (label, last_i, side+1, i-last_i, 1)
-                    self.container_layout.addWidget(label, last_i, side+1, i-last_i, 1)
-                else:
-                    last_idx = idx
-                    last_i = i
-            i += 1
+        if self.found is not None:
+            side, idx = self.found
+            row = int(self.view_layout.row(side, idx))
+            i = np.searchsorted(keys, row * 2 + side, side="right")
+        else:
+            i = np.searchsorted(keys, self.scroll_bar.value() // ROW_HEIGHT * 2)
+        i = int(i) % len(keys)
+        side = int(keys[i] % 2)
+        row = keys[i] // 2
+        hits = danmu if side else sentences
+        idx = hits[self.view_layout.row(side, hits) == row][0]
+        self.search_count.setText(f"{i + 1}/{len(keys)}")
+        self.scroll_to(side, int(idx))
+
+    def init_filters(self):
+        """
+        Code the danmu metadata and fill the filter panel with its values
+        """
+        from .filters import DanmuFilter
+
+        self.danmu_filter = DanmuFilter(self.data.danmu)
+
+        self.streamer_box = QtWidgets.QComboBox()
+        self.streamer_box.addItem("All Streamers")
+        self.streamer_box.addItems([str(v) for v in self.danmu_filter.values("streamer")])
+        self.streamer_box.currentIndexChanged.connect(self.apply_filters)
+
+        self.fan_name_box = QtWidgets.QComboBox()
+        self.fan_name_box.addItem("All Fan Clubs")
+        self.fan_name_box.addItems([str(v) for v in self.danmu_filter.values("fan_name")])
+        self.fan_name_box.currentIndexChanged.connect(self.apply_filters)
+
+        self.level_box = QtWidgets.QSpinBox()
+        self.level_box.setPrefix("Fan Level ≥ ")
+        self.level_box.setRange(0, max(int(self.danmu_filter.fan_level.max(initial=0)), 0))
+        self.level_box.valueChanged.connect(self.apply_filters)
+
+        self.button_clear = QtWidgets.QPushButton("Clear Filters")
+        self.button_clear.setStyleSheet("border: 1px solid black; padding: 5px; background-color: #D7E9FF")
+        self.button_clear.clicked.connect(self.clear_filters)
+
+        self.fp_layout.addWidget(self.streamer_box)
+        self.fp_layout.addWidget(self.fan_name_box)
+        self.fp_layout.addWidget(self.level_box)
+        self.fp_layout.addWidget(self.button_clear)
+
+    def toggle_filters(self):
+        if self.danmu_filter is None:
+            self.init_filters()
+        self.filter_panel.setVisible(not self.filter_panel.isVisible())
+
+    def apply_filters(self):
+        """
+        Show only the danmu passing the filters; the rows are laid out again, reusing the labels
+        """
+        def chosen(box, column):
+            # the first item of a box stands for every value
+            return [self.danmu_filter.values(column)[box.currentIndex() - 1]] if box.currentIndex() > 0 else []
+
+        mask = self.danmu_filter.mask(chosen(self.streamer_box, "streamer"), chosen(self.fan_name_box, "fan_name"),
+                                      self.level_box.value(), self.hidden_users)
+        self.data.filter_danmu(mask)
+        self.update_layout()
+        self.show_suggestions(self.match.left)
+
+    def hide_user(self, username):
+        if self.danmu_filter is None:
+            self.init_filters()
+        self.hidden_users.add(username)
+        self.apply_filters()
+
+    def clear_filters(self):
+        self.hidden_users.clear()
+        for widget in (self.streamer_box, self.fan_name_box, self.level_box):
+            widget.blockSignals(True)
+        self.streamer_box.setCurrentIndex(0)
+        self.fan_name_box.setCurrentIndex(0)
+        self.level_box.setValue(0)
+        for widget in (self.streamer_box, self.fan_name_box, self.level_box):
+            widget.blockSignals(False)
+        self.apply_filters()
 
     def show_dialogue(self):
-        I, J = self.data.dialogue.nonzero()
-        for i, j in zip(I, J):
-            if self.dialogue_show:
-                self.sen_labels[i][0].set_unchosen()
-                self.dan_labels[j][0].set_unchosen()
-            else:
-                self.sen_labels[i][0].set_chosen()
-                self.dan_labels[j][0].set_chosen()
         self.dialogue_show = not self.dialogue_show
+        for labels in (self.sen_labels, self.dan_labels):
+            for label in labels.values():
+                label.update_style()
         self.update()
 
     def delete(self, label):
-        self.container_layout.removeWidget(label)
-        label.hide()
-        self.deleted[label.side].add(label.idx)
+        self.move_rows(label.side, label.idx)
+        self.show_suggestions(self.match.left)
+
+    def move_rows(self, side, idx):
+        """
+        Shift the rows after row idx of side, deleted or restored, and the labels in view with them
+        """
+        self.view_layout.update(side, idx)
+        self.container.invalidate_links(pairs=False)
+        self.update_scroll_range()
+        self.relayout()
+
+    def show_suggestions(self, idx):
+        """
+        Highlight the danmu suggested for sentence idx; None clears them
+        """
+        if idx is not None and self.suggester is None:
+            from .suggest import Suggester
+
+            self.suggester = Suggester(self.data)
+        old = self.match.suggested
+        self.match.suggested = self.suggester.suggest(idx) if idx is not None else []
+        for i in set(old) | set(self.match.suggested):
+            label = self.label(1, i)
+            if label:
+                label.update_style()
+
+    def accept_suggestion(self):
+        """
+        Match the marked sentence with its best suggested danmu; the sentence stays marked, so accepting again takes
+        the next suggestion
+        """
+        if self.match.left is None or not self.match.suggested:
+            return
+        self.match.match(self.match.left, self.match.suggested[0])
+        self.show_suggestions(self.match.left)
+        self.container.update()
+
+    def update_layout(self):
+        self.view_layout = TimelineLayout(self.data.timeline)
+        self.container.invalidate_links()
+        self.update_scroll_range()
+        self.relayout()
 
     def save(self):
-        if self.file_path:
-            data = self.data.data_to_save()
-            file_path = Path(self.file_path)
-            with open(file_path, 'wb') as file:
-                try:
-                    pickle.dump(data, file)
-                except Exception as err:
-                    print(err)
-        else:
+        if not self.file_path:
             self.save_as()
+        elif self.session is not None:
+            from .project import save_project
+
+            # a window holds part of the session, so the whole session is saved with the edits of every window
+            whole, file_path = self.session.capture(), self.file_path
+            self.autosave.submit(lambda: save_project(whole(), file_path))
+        else:
+            self.autosave.save(self.file_path)
 
     def save_as(self):
         file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self,
@@ -475,45 +923,73 @@ class MainWindow(QWidget):
             self.file_path = file_path
             self.save()
 
+    def export(self):
+        file_path, _ = QtWidgets.QFileDialog.getSaveFileName(self,
+                                                             "Export Pairs",
+                                                             "",
+                                                             "JSON Lines (*.jsonl);;CSV Files (*.csv)")
+        if file_path:
+            from . import export
+
+            session = Path(self.file_path).stem if self.file_path else None
+            if self.session is not None:
+                whole = self.session.capture()
+                self.autosave.submit(lambda: export.write_export(export.capture(whole(), session), file_path))
+            else:
+                self.autosave.submit(export.write_export, export.capture(self.data, session), file_path)
+
+    def page(self, step):
+        """
+        Open the window step windows away in place of this one. The session keeps the edits of this window and writes
+        them down, so its journal is given up as it closes and never replayed on top of them.
+        """
+        data = self.session.page(step)
+        self.audio.close()
+        self.autosave.close()
+        mw = MainWindow(data, 0, parent=self.parent, session=self.session)
+        mw.file_path = self.file_path
+        mw.show()
+        self.deleteLater()
+
     def select_file(self):
         self.parent.show()
+        self.audio.close()
+        self.autosave.close()
+        if self.session is not None:
+            self.session.close()
         self.deleteLater()
 
+    def closeEvent(self, event):
+        self.audio.close()
+        self.autosave.close()
+        if self.session is not None:
+            self.session.close()
+        super(MainWindow, self).closeEvent(event)
+
     def undo(self):
-        if len(self.data.history) == 0:
-            return
-        where, action = self.data.history[-1]
-        content = self.data.undo()
-
-        if action == "delete":
-            if where == "sentence" or where == "danmu":
-                idx = content.name
-                widget_data = self.sen_labels[idx] if where == "sentence" else self.dan_labels[idx]
-                label = widget_data[0]
-                self.container_layout.addWidget(*widget_data)
-                self.deleted[label.side].remove(label.idx)
-                label.show()
-            elif where == "dialogue":
-                pass
-            else:
-                raise
+        self.refresh(self.data.undo())
 
-        elif action == "modify":
-            if where == "sentence" or where == "danmu":
-                idx, content = content
-                label = self.dan_labels[idx][0] if (where == "danmu") else self.sen_labels[idx][0]
-                label.label.setText(content)
-            else:
-                raise
+    def redo(self):
+        self.refresh(self.data.redo())
 
-        elif action[0] == "match":
-            if where == "dialogue":
-                pass
+    def refresh(self, edits):
+        """
+        Bring the view in line with the data after undoing or redoing edits
+        """
+        for edit in edits:
+            if edit.where == "dialogue":
+                self.match.update_labels(*edit.idx)
+                self.container.invalidate_links()
+            elif edit.action == "delete":
+                self.move_rows(0 if edit.where == "sentence" else 1, edit.idx)
+            elif edit.action == "modify":
+                label = self.label(0 if edit.where == "sentence" else 1, edit.idx)
+                if label:
+                    label.bind(edit.idx)
             else:
                 raise
-        else:
-            raise
 
+        self.show_suggestions(self.match.left)
         self.container.update()
 
 
@@ -567,9 +1043,13 @@ class SentenceFileLabel(FileLabel):
         self.l_label = QLabel(path.name, self)
 
         fp = path.parent / path.stem
+        wav = path.with_suffix(".wav")
         if fp.exists():
             self.r_label = QLabel(path.stem, self)
             self.folder_path = fp.__str__()
+        elif wav.exists():
+            self.r_label = QLabel(wav.name, self)
+            self.folder_path = wav.__str__()
         else:
             self.r_label = QLabel("Select .wav Directory", self)
 
@@ -629,6 +1109,8 @@ class SentenceFileLabel(FileLabel):
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
             self.select_wav()
+        elif event.button() == Qt.RightButton:
+            self.select_session_wav()
 
     def init_time_zone_box(self):
         for i in range(24):
@@ -646,6 +1128,12 @@ class SentenceFileLabel(FileLabel):
         self.r_label.setText(Path(file_folder).name)
         self.folder_path = file_folder
 
+    def select_session_wav(self):
+        file_name = self.parent.select_wav_file()
+        if file_name:
+            self.r_label.setText(Path(file_name).name)
+            self.folder_path = file_name
+
     def current_text_changed(self, s):
         self.time_zone = s
 
@@ -664,6 +1152,15 @@ class PreMainWidget(QWidget):
         self.launch_button.clicked.connect(self.launch)
         self.launch_button.setStyleSheet("border: 1px solid #FFEFC1; padding: 3px; background-color: #FFEFC1")
 
+        self.window_edit = QtWidgets.QLineEdit(self)
+        self.window_edit.setPlaceholderText("Time window, e.g. 01:00-01:30; empty for the whole session")
+        self.window_edit.setFixedHeight(32)
+
+        self.open_button = QtWidgets.QPushButton("Open Project", self)
+        self.open_button.setFixedHeight(32)
+        self.open_button.clicked.connect(self.open_project)
+        self.open_button.setStyleSheet("border: 1px solid #D7E9FF; padding: 3px; background-color: #D7E9FF")
+
         self.danmu_box = QWidget(self)
         self.danmu_box_layout = QVBoxLayout(self.danmu_box)
         self.danmu_box.setLayout(self.danmu_box_layout)
@@ -673,6 +1170,8 @@ class PreMainWidget(QWidget):
         self.sentence_box.setLayout(self.sentence_box_layout)
 
         self.layout.addWidget(self.launch_button)
+        self.layout.addWidget(self.window_edit)
+        self.layout.addWidget(self.open_button)
         self.layout.addWidget(self.danmu_box)
         self.layout.addWidget(self.sentence_box)
 
@@ -706,6 +1205,11 @@ class PreMainWidget(QWidget):
         folder_name = QtWidgets.QFileDialog.getExistingDirectory(self, "Select Folder", "", options=options)
         return folder_name
 
+    def select_wav_file(self):
+        options = QtWidgets.QFileDialog.Options()
+        file_name, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Select Session Audio", "", "WAV Files (*.wav)", options=options)
+        return file_name
+
     def select_sentence_file(self):
         file_names = self.select_file()
         if file_names:
@@ -781,6 +1285,9 @@ class PreMainWidget(QWidget):
                     raise Exception(f"Time zone {label.time_zone_code} has unknown exception")
 
     def launch(self):
+        from .data import Data, time_stamp
+        from .cache import ParseCache
+
         try:
             self.verify()
             danmu_file = []
@@ -793,17 +1300,45 @@ class PreMainWidget(QWidget):
                 ts = time_stamp(sentence_label.start_time, sentence_label.time_zone_code)
                 sentence_dirs.append((sentence_label.folder_path, sentence_label.file_path, (ts-ts0)))
 
-            data = Data(sentence_dirs, danmu_file)
+            if self.window_edit.text().strip():
+                from .window import WindowedSession, parse_window
 
-            t0 = data.danmu.t0
+                start, length = parse_window(self.window_edit.text())
+                session = WindowedSession(sentence_dirs, danmu_file, ts0, length)
+                session.recover(lambda: confirm_recover(self))
+                # the danmu of a window come shifted
+                mw = MainWindow(session.open(start), 0, parent=self, session=session)
+            else:
+                data = Data(sentence_dirs, danmu_file, cache=ParseCache())
+
+                t0 = data.danmu.t0
 
-            mw = MainWindow(data, t0-ts0, parent=self)
+                mw = MainWindow(data, t0-ts0, parent=self)
             mw.show()
             self.hide()
 
         except FileLabelException as err:
             print(err)
 
+    def open_project(self):
+        options = QtWidgets.QFileDialog.Options()
+        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Open Project", "", "PSR Files (*.psr);;All Files (*)", options=options)
+        if not file_path:
+            return
+        from .project import load_project
+
+        try:
+            data = load_project(file_path)
+        except (OSError, ProjectFormatError) as err:
+            print(err)
+            return
+
+        # the danmu of a project are stored already shifted
+        mw = MainWindow(data, 0, parent=self)
+        mw.file_path = file_path
+        mw.show()
+        self.hide()
+
 
 if __name__ == "__main__":
     sen_dirs = ((
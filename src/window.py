@@ -0,0 +1,299 @@
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .data import Data, Sentences, Danmu, Dialogue, SENTENCE_COLUMNS, _with_audio
+from .cache import ParseCache
+from .journal import JOURNAL_VERSION, AUTOSAVE_DIR, session_key, _try_lock
+from .project import json_default, write_atomic
+from .exceptions import WindowFormatIncorrect
+
+# ms of a window and of the margin loaded on each side of it
+WINDOW = 30 * 60 * 1000
+MARGIN = 60 * 1000
+# transcript rows parsed at a time while looking for a window
+CHUNK_ROWS = 100000
+
+
+def parse_clock(text):
+    """
+    :param text: hh:mm or hh:mm:ss
+    :return: ms
+    """
+    parts = text.strip().split(":")
+    if len(parts) not in (2, 3) or not all(part.isdigit() for part in parts):
+        raise WindowFormatIncorrect(f"Time {text} has incorrect format")
+    seconds = 0
+    for part in parts + ["0"] * (3 - len(parts)):
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000
+
+
+def parse_window(text):
+    """
+    :param text: window as hh:mm-hh:mm, from the start of the first transcript
+    :return: (start, length) in ms
+    """
+    if text.count("-") != 1:
+        raise WindowFormatIncorrect(f"Window {text} has incorrect format")
+    start, end = map(parse_clock, text.split("-"))
+    if end <= start:
+        raise WindowFormatIncorrect(f"Window {text} ends before it starts")
+    return start, end - start
+
+
+def format_clock(t):
+    """
+    :param t: ms
+    :return: hh:mm:ss, with a sign before the first transcript starts
+    """
+    seconds = abs(int(t)) // 1000
+    return f"{'-' if t < 0 else ''}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def _read_sentences(sen_dir, sen_txt_file, t, lo, hi, chunk_rows=CHUNK_ROWS):
+    """
+    Read the sentences of one transcript starting from lo to hi, parsing the file only up to hi
+
+    :param t: time offset of the transcript in ms
+    :return: (Sentences, number of sentences starting before lo)
+    """
+    frames = []
+    before = 0
+    for chunk in pd.read_csv(sen_txt_file, header=None, names=SENTENCE_COLUMNS, index_col=0, chunksize=chunk_rows):
+        start = chunk["start"].to_numpy() + t
+        before += int((start < lo).sum())
+        frames.append(chunk[(start >= lo) & (start < hi)])
+        # transcripts are sorted by start
+        if len(start) and start[-1] >= hi:
+            break
+    data = pd.concat(frames)
+    return Sentences(data=_with_audio(data, sen_dir)), before
+
+
+class WindowedSession:
+    def __init__(self, sen_dirs, danmu_file, ts0, length=WINDOW, margin=MARGIN, time_zone=None, root=None):
+        """
+        A session too long to open at once, opened one time window at a time. Only the rows of the window and a
+        margin around it are read: the danmu files are seeked into with their time index, and reading a transcript
+        stops after the window.
+
+        The rows of a window are indexed from 0 as in any Data, so the view, journal and projects work on a window
+        unchanged; the session keeps the global key of each row, its position in the whole session, and carries the
+        edits of the windows paged away from to the windows opened after them. Those edits are written to the autosave
+        directory as they are kept, the journal of a window being given up when it is paged away from, and taken up
+        again by recover if the run crashes.
+
+        :param sen_dirs: list of (sen_dir, sen_txt_file, t), as Data
+        :param danmu_file: file path to the danmu file, or a list of them
+        :param ts0: unix time in ms of the start of the first transcript, which window times are counted from
+        :param length: ms of a window
+        :param margin: ms of rows loaded on each side of a window, so replies across its edges can be matched
+        :param time_zone: time zone the danmu times are recorded in; None for the local time zone
+        :param root: directory of the kept edits; defaults to the autosave directory
+        """
+        self.sen_dirs = list(sen_dirs)
+        self.danmu_files = [danmu_file] if isinstance(danmu_file, str) else list(danmu_file)
+        self.sources = [(sen_txt_file, t) for _, sen_txt_file, t in self.sen_dirs] + [(df, 0) for df in self.danmu_files]
+        self.ts0 = ts0
+        self.length = length
+        self.margin = margin
+        self.time_zone = time_zone
+        self.key = session_key(self.sources)
+        self.root = Path(root or os.environ.get("PSR_AUTOSAVE_DIR") or AUTOSAVE_DIR)
+        # the open lock file of the kept edits, while this run holds it
+        self._lock = None
+
+        # edits of the windows paged away from, by global key: (where, key) -> content, (where, key) -> alive and
+        # (sentence key, danmu key) -> linked
+        self.contents = {}
+        self.alive = {}
+        self.links = {}
+
+        self.start = None
+        self.data = None
+        # global key of the first row of the open window; the keys of its rows are consecutive
+        self.first = {"sentence": 0, "danmu": 0}
+
+    def keys(self, where, idx):
+        """
+        :return: global keys of the rows idx of the open window
+        """
+        return np.asarray(idx) + self.first[where]
+
+    def open(self, start):
+        """
+        Open the window from start to start + length ms, keeping the edits of the window open before
+
+        :return: Data of the window, its danmu shifted against the sentences
+        """
+        if self.data is not None:
+            self.fold()
+        lo, hi = start - self.margin, start + self.length + self.margin
+
+        sentences, sen_before = zip(*(_read_sentences(sen_dir, sen_txt_file, t, lo, hi)
+                                      for sen_dir, sen_txt_file, t in self.sen_dirs))
+        danmu, dan_before = zip(*(Danmu.read_span(df, self.ts0 + lo, self.ts0 + hi, self.time_zone)
+                                  for df in self.danmu_files))
+        sentences = Sentences.merge(list(sentences), [t for _, _, t in self.sen_dirs])
+        danmu = Danmu.merge(list(danmu), [d.t0 - danmu[0].t0 for d in danmu])
+        self.first = {"sentence": sum(sen_before), "danmu": sum(dan_before)}
+
+        tables = {"sentence": sentences, "danmu": danmu}
+        for (where, key), content in self.contents.items():
+            idx = key - self.first[where]
+            if 0 <= idx < len(tables[where].data):
+                tables[where].data.loc[idx, "content"] = content
+        for (where, key), alive in self.alive.items():
+            idx = key - self.first[where]
+            if 0 <= idx < len(tables[where].data):
+                tables[where].alive[idx] = alive
+
+        rows, cols = [], []
+        for (l_key, r_key), linked in self.links.items():
+            l_idx, r_idx = l_key - self.first["sentence"], r_key - self.first["danmu"]
+            if linked and 0 <= l_idx < len(sentences.data) and 0 <= r_idx < len(danmu.data):
+                rows.append(l_idx)
+                cols.append(r_idx)
+        dialogue = Dialogue.from_coo(rows, cols, (len(sentences), len(danmu)))
+
+        data = Data.from_tables(sentences, danmu, dialogue, self.sources)
+        data.shift_danmu(danmu.t0 - self.ts0)
+        # each window journals apart, its rows being indexed from its own start
+        data.project = {"session": f"{self.key}-{lo}-{hi}"}
+        self.start = start
+        self.data = data
+        return data
+
+    def edits(self):
+        """
+        :return: (contents, alive, links) as kept by the session, with the edits made in the open window
+        """
+        contents, alive, links = dict(self.contents), dict(self.alive), dict(self.links)
+        for edits in self.data.history if self.data is not None else ():
+            for edit in edits:
+                if edit.where == "dialogue":
+                    l_idx, r_idx = edit.idx
+                    links[int(self.keys("sentence", l_idx)), int(self.keys("danmu", r_idx))] = edit.after
+                elif edit.action == "modify":
+                    contents[edit.where, int(self.keys(edit.where, edit.idx))] = edit.after
+                else:
+                    alive[edit.where, int(self.keys(edit.where, edit.idx))] = edit.after
+        return contents, alive, links
+
+    def fold(self):
+        """
+        Keep the edits made in the open window, by global key, and write them down
+        """
+        self.contents, self.alive, self.links = self.edits()
+        self._store()
+
+    def edits_path(self):
+        return self.root / f"{self.key}-session.edits"
+
+    def lock_path(self):
+        return self.root / f"{self.key}-session.lock"
+
+    def recover(self, confirm=None):
+        """
+        Take up the edits kept by an earlier run of the session which crashed, then start writing down the edits kept.
+        While another run of the session goes on, nothing is taken up or written.
+
+        :param confirm: callable returning whether to take up the edits found, called only if some are found; None to
+            take them up without asking. Edits not taken up are removed.
+        :return: number of edits taken up
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        file = open(self.lock_path(), "a+")
+        if not _try_lock(file):
+            file.close()
+            return 0
+        self._lock = file
+
+        try:
+            with open(self.edits_path(), encoding="utf-8") as file:
+                kept = json.load(file)
+        except (OSError, ValueError):
+            kept = None
+        if kept is None or not (kept["contents"] or kept["alive"] or kept["links"]):
+            return 0
+        if confirm is not None and not confirm():
+            self._discard()
+            return 0
+        self.contents.update({(where, key): content for where, key, content in kept["contents"]})
+        self.alive.update({(where, key): alive for where, key, alive in kept["alive"]})
+        self.links.update({(l_key, r_key): linked for l_key, r_key, linked in kept["links"]})
+        return len(kept["contents"]) + len(kept["alive"]) + len(kept["links"])
+
+    def _store(self):
+        if self._lock is None:
+            return
+        kept = {"version": JOURNAL_VERSION,
+                "contents": [[where, key, content] for (where, key), content in self.contents.items()],
+                "alive": [[where, key, alive] for (where, key), alive in self.alive.items()],
+                "links": [[l_key, r_key, linked] for (l_key, r_key), linked in self.links.items()]}
+        try:
+            text = json.dumps(kept, default=json_default)
+            write_atomic(self.edits_path(), lambda file: file.write(text.encode("utf-8")))
+        except (OSError, ValueError) as err:
+            print(err)
+
+    def _discard(self):
+        try:
+            os.remove(self.edits_path())
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """
+        Stop writing down the edits kept and remove them, the edits not saved being given up by closing
+        """
+        if self._lock is None:
+            return
+        self._discard()
+        self._lock.close()
+        self._lock = None
+        try:
+            os.remove(self.lock_path())
+        except OSError:
+            # another run locked it meanwhile
+            pass
+
+    def capture(self):
+        """
+        Copy the edits of every window, cheap enough to do on the UI thread
+
+        :return: callable returning Data of the whole session to save or export, the edits of every window made to its
+            tables by global key, as apply_labels leaves them but with no history, and no timeline built. It reads
+            every input through the parse cache, so it is meant to be called on another thread.
+        """
+        contents, alive, links = self.edits()
+
+        def whole():
+            data = Data(self.sen_dirs, self.danmu_files, cache=ParseCache(), time_zone=self.time_zone, timeline=False)
+            data.shift_danmu(data.danmu.t0 - self.ts0)
+            tables = {"sentence": data.sentences, "danmu": data.danmu}
+            for (where, key), content in contents.items():
+                tables[where].modify(key, content)
+            for (where, key), kept in alive.items():
+                if not kept:
+                    tables[where].delete(key)
+            linked = [link for link, value in links.items() if value]
+            rows, cols = zip(*linked) if linked else ((), ())
+            data.dialogue = Dialogue.from_coo(list(rows), list(cols), data.dialogue.shape)
+            return data
+
+        return whole
+
+    def page(self, step):
+        """
+        :param step: windows to move by, negative to go back
+        :return: Data of the window step windows from the open one
+        """
+        return self.open(self.start + step * self.length)
+
+    def label(self):
+        return f"{format_clock(self.start)}-{format_clock(self.start + self.length)}"